@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Latency of a non-auth endpoint while other clients log in.
+
+Runs the threaded server twice, hashing passwords on the request threads
+(PASSWORD_HASH_WORKERS=0) and then in the process pool, and reports the
+latency of GET /api/activity_types (token authentication) during a storm of
+POST /api/authenticate requests.
+
+    python benchmarks/login_storm.py [login_threads] [seconds]
+"""
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from lifehistory import create_app, init_db
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark password'
+
+
+def call(url, method='GET', data=None, headers=None):
+    headers = dict(headers or {})
+    body = None
+    if data is not None:
+        body = json.dumps(data).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    request = Request(url, data=body, headers=headers, method=method)
+    try:
+        with urlopen(request) as response:
+            return response.status, response.read()
+    except HTTPError as error:
+        return error.code, error.read()
+
+
+def basic_auth(username, password):
+    credentials = ('%s:%s' % (username, password)).encode('utf-8')
+    return {'Authorization': 'Basic ' + base64.b64encode(credentials).decode('ascii')}
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def run(workers, login_threads, duration):
+    directory = tempfile.mkdtemp()
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'db.sqlite'),
+            'SECRET_KEY': 'benchmark',
+            'PASSWORD_HASH_WORKERS': workers,
+            'PASSWORD_HASH_MAX_PENDING': login_threads,
+            'PASSWORD_HASH_TIMEOUT': 60
+        })
+        with app.app_context():
+            init_db()
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:%d' % server.server_port
+
+        call(url + '/api/users', 'POST', {'username': USERNAME, 'password': PASSWORD})
+        status, body = call(url + '/api/token', headers=basic_auth(USERNAME, PASSWORD))
+        token = json.loads(body.decode('utf-8'))['token']
+
+        stop = threading.Event()
+        logins = []
+
+        def login():
+            while not stop.is_set():
+                call(url + '/api/authenticate', 'POST', {'username': USERNAME, 'password': PASSWORD})
+                logins.append(1)
+
+        threads = [threading.Thread(target=login) for i in range(login_threads)]
+        for thread in threads:
+            thread.start()
+
+        latencies = []
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            call(url + '/api/activity_types', headers=basic_auth(token, 'unused'))
+            latencies.append(time.perf_counter() - start)
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        server.shutdown()
+
+        print('PASSWORD_HASH_WORKERS=%d: %d logins, activity_types p50 %.1fms p95 %.1fms max %.1fms' % (
+            workers, len(logins),
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.95) * 1000, max(latencies) * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    login_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run(0, login_threads, duration)
+    run(2, login_threads, duration)
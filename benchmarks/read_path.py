@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""CPU time and memory of the Core read path against the ORM one.
+
+Seeds an in-memory database and, for each endpoint, runs the ORM code the
+handlers used before and the queries module, checking that both give the
+same JSON.
+
+    python benchmarks/read_path.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, time as day_time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lifehistory import create_app, init_db, queries
+from lifehistory.database import db, read_session
+from lifehistory.models import User, ActivityType, Activity, Day, LifeEntry, LifeEntryActivity
+
+DATE = datetime(2017, 9, 14)
+
+
+def seed():
+    user = User(username='benchmark')
+    db.session.add(user)
+    db.session.flush()
+
+    activity_types = []
+    for i in range(10):
+        activity_type = ActivityType()
+        activity_type.user_id = user.id
+        activity_type.name = 'Activity type %d' % i
+        activity_type.show_quantity = i % 2 == 0
+        activity_type.show_rating = True
+        activity_types.append(activity_type)
+    db.session.add_all(activity_types)
+    db.session.flush()
+
+    activities = []
+    for i in range(200):
+        activity = Activity()
+        activity.user_id = user.id
+        activity.name = 'Activity %d' % i
+        activity.activity_type_id = activity_types[i % len(activity_types)].id
+        activities.append(activity)
+    db.session.add_all(activities)
+
+    day = Day()
+    day.user_id = user.id
+    day.date = DATE
+    day.note = 'Benchmark day'
+    db.session.add(day)
+    db.session.flush()
+
+    for hour in range(20):
+        life_entry = LifeEntry()
+        life_entry.user_id = user.id
+        life_entry.day_id = day.id
+        life_entry.start_time = day_time(hour, 0)
+        life_entry.end_time = day_time(hour, 30)
+        db.session.add(life_entry)
+        db.session.flush()
+        for i in range(3):
+            life_entry_activity = LifeEntryActivity()
+            life_entry_activity.user_id = user.id
+            life_entry_activity.life_entry_id = life_entry.id
+            life_entry_activity.activity_id = activities[(hour * 3 + i) % len(activities)].id
+            life_entry_activity.description = 'Description %d' % i
+            life_entry_activity.quantity = 1.5
+            life_entry_activity.rating = i
+            db.session.add(life_entry_activity)
+
+    db.session.commit()
+    return user.id, life_entry.id
+
+
+def orm_paths(user_id, life_entry_id):
+    # Same order as the endpoints: by id
+    return {
+        'get_activity_types': lambda: [ActivityType.serialize(activity_type) for activity_type in ActivityType.query.filter_by(user_id=user_id).order_by(ActivityType.id).all()],
+        'get_activities': lambda: [Activity.serialize(activity) for activity in Activity.query.filter_by(user_id=user_id).order_by(Activity.id).all()],
+        'get_day_by_date': lambda: Day.serialize(Day.query.filter((Day.user_id == user_id) & (Day.date == DATE)).first()),
+        'get_life_entry': lambda: LifeEntry.serialize(LifeEntry.query.get(life_entry_id)),
+    }
+
+
+def core_paths(user_id, life_entry_id):
+    return {
+        'get_activity_types': lambda: queries.get_activity_types(user_id),
+        'get_activities': lambda: queries.get_activities(user_id),
+        'get_day_by_date': lambda: queries.get_day_by_date(user_id, DATE),
+        'get_life_entry': lambda: queries.get_life_entry(life_entry_id)[1],
+    }
+
+
+def request(path):
+    result = json.dumps(path(), sort_keys=True)
+    # what the teardown does at the end of each request
+    read_session.remove()
+    return result
+
+
+def measure(path, iterations):
+    request(path)
+    start = time.process_time()
+    for i in range(iterations):
+        request(path)
+    cpu = (time.process_time() - start) / iterations
+
+    tracemalloc.start()
+    request(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'benchmark', 'PASSWORD_HASH_WORKERS': 0})
+    with app.app_context():
+        init_db()
+        user_id, life_entry_id = seed()
+
+    orm = orm_paths(user_id, life_entry_id)
+    core = core_paths(user_id, life_entry_id)
+
+    print('%-20s %12s %12s %12s %12s' % ('endpoint', 'ORM cpu', 'Core cpu', 'ORM peak', 'Core peak'))
+    with app.test_request_context('/', method='GET'):
+        for name in sorted(orm):
+            assert request(orm[name]) == request(core[name]), name
+            orm_cpu, orm_peak = measure(orm[name], iterations)
+            core_cpu, core_peak = measure(core[name], iterations)
+            print('%-20s %10.3fms %10.3fms %10.1fKB %10.1fKB' % (name, orm_cpu * 1000, core_cpu * 1000,
+                                                                 orm_peak / 1024.0, core_peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""Measure how fast a worker starts.
+
+Reports the time to import the application, to create app instances and to
+serve a first request. All apps use their own in-memory database, so this
+also checks that many instances can run side by side in one process.
+
+    python benchmarks/startup.py [number_of_apps]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+start = time.perf_counter()
+from lifehistory import create_app, init_db
+import_time = time.perf_counter() - start
+
+number_of_apps = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+start = time.perf_counter()
+apps = [create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'benchmark'}) for i in range(number_of_apps)]
+create_time = time.perf_counter() - start
+
+start = time.perf_counter()
+for app in apps:
+    with app.app_context():
+        init_db()
+    response = app.test_client().get('/api/users/1')
+    assert response.status_code == 400
+first_request_time = time.perf_counter() - start
+
+print('import:        %8.2f ms' % (import_time * 1000))
+print('create_app:    %8.2f ms per app (%d apps)' % (create_time * 1000 / number_of_apps, number_of_apps))
+print('first request: %8.2f ms per app, including create_all' % (first_request_time * 1000 / number_of_apps))
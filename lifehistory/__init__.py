@@ -0,0 +1,59 @@
+import os
+
+from flask import Flask
+from flask_cors import CORS
+from . import cache, config, database, passwords
+from .archive import index_archived_days, reserve_archived_ids
+from .database import db, create_missing_columns, create_missing_indexes, drop_indexes, enable_sqlite_autoincrement
+from .models import ActivityUsage
+from .notifications import LocalBroker
+from .routes import api
+
+# Indexes created by earlier versions that no query uses
+OBSOLETE_INDEXES = ['ix_activity_usages_user_id_score', 'ix_activities_user_id_name']
+
+
+def create_app(overrides=None):
+    """Create an application: defaults, then the environment, then overrides.
+
+    Nothing connects to the database here, engines are created on first use.
+    Several applications can live in the same process (tests, benchmarks).
+    Raises RuntimeError when SECRET_KEY is missing outside of DEBUG and TESTING.
+    """
+    app = Flask(__name__)
+    app.root_path = config.PROJECT_ROOT
+    app.config.update(config.DEFAULTS)
+    app.config.update(config.from_environment())
+    if overrides:
+        app.config.update(overrides)
+    if not app.config['SECRET_KEY']:
+        if not (app.config['DEBUG'] or app.config['TESTING']):
+            raise RuntimeError('SECRET_KEY is not set, set LIFEHISTORY_SECRET_KEY')
+        # Tokens signed with this key do not survive a restart
+        app.config['SECRET_KEY'] = os.urandom(24)
+
+    database.init_app(app)
+    passwords.init_app(app)
+    cache.init_app(app)
+    app.extensions['broker'] = LocalBroker()
+    app.register_blueprint(api)
+
+    # A Flask extension for handling Cross Origin Resource Sharing (CORS)
+    CORS(app)
+
+    return app
+
+
+def init_db():
+    """Create missing tables, columns and indexes. Must run inside an application context."""
+    db.create_all()
+    create_missing_columns()
+    if enable_sqlite_autoincrement():
+        # A rebuilt table only remembers its largest id, not the ids of the archived rows
+        reserve_archived_ids()
+    create_missing_indexes()
+    drop_indexes(OBSOLETE_INDEXES)
+    index_archived_days()
+    if ActivityUsage.query.first() is None:
+        ActivityUsage.rebuild_all()
+        db.session.commit()
@@ -0,0 +1,153 @@
+"""Cold storage of old days.
+
+Days older than the horizon are moved, with their life entries and life entry
+activities, to the archived_days table. The read endpoints fall through to it,
+and a day is moved back to the hot tables the first time it is modified.
+"""
+import re
+from datetime import datetime, timedelta
+from .database import db, reserve_sqlite_ids
+from .models import (Day, LifeEntry, LifeEntryActivity, ArchivedDay, ArchivedLifeEntryActivity,
+                     get_activities_by_id, get_date_string)
+
+REPORTED_TABLES = (Day, LifeEntry, LifeEntryActivity, ArchivedDay)
+
+
+def archive_days(horizon, user_id=None, batch_size=100):
+    """Archive the days older than horizon days. Returns the number of days archived."""
+    before = datetime.utcnow() - timedelta(days=horizon)
+    archived = 0
+    while True:
+        query = Day.query.filter(Day.date < before)
+        if user_id is not None:
+            query = query.filter(Day.user_id == user_id)
+        days = query.order_by(Day.date).limit(batch_size).all()
+        if not days:
+            return archived
+
+        for day in days:
+            db.session.add(ArchivedDay.from_day(day))
+            life_entry_ids = [life_entry_id for life_entry_id, in db.session.query(LifeEntry.id).filter(LifeEntry.day_id == day.id)]
+            if life_entry_ids:
+                LifeEntryActivity.query.filter(LifeEntryActivity.life_entry_id.in_(life_entry_ids)).delete(synchronize_session=False)
+                LifeEntry.query.filter(LifeEntry.day_id == day.id).delete(synchronize_session=False)
+            db.session.delete(day)
+
+        db.session.commit()
+        archived += len(days)
+
+
+def index_archived_days():
+    """Fill the archived life entry tables for the days archived before they existed."""
+    for archived_day in ArchivedDay.query.filter(~ArchivedDay.archived_life_entries.any()):
+        archived_day.index_entries()
+    db.session.commit()
+
+
+def reserve_archived_ids():
+    """Keep SQLite from handing out the ids of archived rows to new ones."""
+    max_ids = {Day: 0, LifeEntry: 0, LifeEntryActivity: 0}
+    for archived_day in ArchivedDay.query:
+        max_ids[Day] = max(max_ids[Day], archived_day.id)
+        for life_entry in archived_day.get_data()['life_entries']:
+            max_ids[LifeEntry] = max(max_ids[LifeEntry], life_entry['id'])
+            for life_entry_activity in life_entry['life_entry_activities']:
+                max_ids[LifeEntryActivity] = max(max_ids[LifeEntryActivity], life_entry_activity['id'])
+    db.session.rollback()
+    for model, max_id in max_ids.items():
+        if max_id:
+            reserve_sqlite_ids(model.__tablename__, max_id)
+
+
+def get_search_id(value):
+    """The id an SQL comparison with value matches, None when it matches no id ("5" matches 5)."""
+    try:
+        integer = int(value)
+    except (TypeError, ValueError):
+        return None
+    if integer == value or str(integer) == value:
+        return integer
+    return None
+
+
+def get_like_regex(pattern):
+    """A regular expression matching like SQLite's LIKE: % and _ wildcards, ASCII letters in any case."""
+    parts = ['.*' if character == '%' else '.' if character == '_' else re.escape(character) for character in pattern]
+    return re.compile(''.join(parts) + r'\Z', re.IGNORECASE | re.ASCII | re.DOTALL)
+
+
+def search_archived_days(session, user_id, activity_id=None, activity_type_id=None, start_date=None, end_date=None, text=None):
+    """Same filters and result rows as the life entries search, on archived days."""
+    if activity_id is not None:
+        activity_id = get_search_id(activity_id)
+        if activity_id is None:
+            return []
+    if activity_type_id is not None:
+        activity_type_id = get_search_id(activity_type_id)
+        if activity_type_id is None:
+            return []
+
+    query = session.query(ArchivedDay).filter(ArchivedDay.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(ArchivedDay.date >= start_date)
+    if end_date is not None:
+        query = query.filter(ArchivedDay.date <= end_date)
+    if activity_id is not None:
+        archived_day_ids = session.query(ArchivedLifeEntryActivity.archived_day_id).\
+            filter(ArchivedLifeEntryActivity.activity_id == activity_id)
+        query = query.filter(ArchivedDay.id.in_(archived_day_ids.subquery()))
+    archived_days = query.all()
+
+    all_data = [archived_day.get_data() for archived_day in archived_days]
+    activities = get_activities_by_id((life_entry_activity['activity_id']
+                                       for data in all_data
+                                       for life_entry in data['life_entries']
+                                       for life_entry_activity in life_entry['life_entry_activities']),
+                                      session)
+    if text is not None:
+        text_regex = get_like_regex('%' + text + '%')
+
+    def matches(life_entry_activity, activity):
+        if activity is None or activity.activity_type is None:
+            return False
+        if activity_id is not None and activity.id != activity_id:
+            return False
+        if activity_type_id is not None and activity.activity_type_id != activity_type_id:
+            return False
+        if text is not None:
+            values = (activity.name, activity.activity_type.name, life_entry_activity['description'])
+            # A NULL description is not LIKE anything
+            return any(value is not None and text_regex.match(value) for value in values)
+        return True
+
+    results = []
+    for archived_day, data in zip(archived_days, all_data):
+        for life_entry in data['life_entries']:
+            for life_entry_activity in life_entry['life_entry_activities']:
+                activity = activities.get(life_entry_activity['activity_id'])
+                if not matches(life_entry_activity, activity):
+                    continue
+                results.append({
+                    'day_id': archived_day.id,
+                    'date': get_date_string(archived_day.date),
+                    'start_time': life_entry['start_time'],
+                    'end_time': life_entry['end_time'],
+                    'description': life_entry_activity['description'],
+                    'quantity': life_entry_activity['quantity'],
+                    'rating': life_entry_activity['rating'],
+                    'activity_type_name': activity.activity_type.name,
+                    'activity_name': activity.name
+                })
+    return results
+
+
+def merge_search_results(results, archived_results):
+    if not archived_results:
+        return results
+    # newest first, like the SQL query
+    return sorted(results + archived_results, key=lambda result: (result['date'], result['start_time']), reverse=True)
+
+
+def get_table_sizes():
+    return dict((model.__tablename__, model.query.count()) for model in REPORTED_TABLES)
+
@@ -0,0 +1,101 @@
+"""Cache of serialized search results.
+
+Entries are keyed by user, endpoint, parameters and the user's data version,
+users.data_version. A transaction changing a user's searchable rows bumps that
+version in the same commit, which invalidates all of the user's entries at once
+in every worker process; the stale ones are evicted by the LRU.
+"""
+import threading
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SessionBase
+from .models import User, ActivityType, Activity, Day, LifeEntry, LifeEntryActivity, ArchivedDay
+
+# Models read by the cached endpoints
+CACHED_MODELS = (ActivityType, Activity, Day, LifeEntry, LifeEntryActivity, ArchivedDay)
+
+# Rough size of a key and its OrderedDict slot, added to the size of the value
+ENTRY_OVERHEAD = 200
+
+
+class SearchCache(object):
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, user, endpoint, params, compute):
+        """Return the cached result of compute(), a string, or compute and cache it."""
+        # The user, with its version, is loaded first: a result computed during a write is stored under the old version
+        key = (user.id, user.data_version, endpoint, params)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = compute()
+        self._add(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / requests if requests else None,
+                'entries': len(self._entries),
+                'size': self._size,
+                'max_size': self.max_size
+            }
+
+    def _add(self, key, value):
+        size = len(value) + ENTRY_OVERHEAD
+        if size > self.max_size:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous) + ENTRY_OVERHEAD
+            self._entries[key] = value
+            self._size += size
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted) + ENTRY_OVERHEAD
+
+
+def init_app(app):
+    app.extensions['search_cache'] = SearchCache(app.config['SEARCH_CACHE_SIZE'])
+
+
+def get_search_cache():
+    return current_app.extensions['search_cache']
+
+
+@event.listens_for(SessionBase, 'after_flush')
+def bump_data_versions(session, flush_context):
+    # Once per transaction is enough, other processes only see the committed version
+    bumped_users = session.info.setdefault('bumped_users', set())
+    changed_users = set()
+    for instances in (session.new, session.dirty, session.deleted):
+        for instance in instances:
+            if isinstance(instance, CACHED_MODELS) and instance.user_id not in bumped_users:
+                changed_users.add(instance.user_id)
+    if changed_users:
+        session.execute(User.__table__.update().
+                        where(User.id.in_(changed_users)).
+                        values(data_version=User.data_version + 1))
+        bumped_users.update(changed_users)
+
+
+@event.listens_for(SessionBase, 'after_commit')
+@event.listens_for(SessionBase, 'after_rollback')
+def forget_bumped_users(session):
+    session.info.pop('bumped_users', None)
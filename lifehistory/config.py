@@ -0,0 +1,59 @@
+import os
+
+# Relative SQLite paths are resolved from here, where api.py lives
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every key can be overridden with a LIFEHISTORY_<KEY> environment variable
+DEFAULTS = {
+    # Signs the access tokens. Required unless DEBUG or TESTING is set, which use a random key.
+    'SECRET_KEY': None,
+    'DEBUG': False,
+    'TESTING': False,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///db.sqlite',
+    'SQLALCHEMY_COMMIT_ON_TEARDOWN': True,
+    # Lifetimes, in seconds, of the access tokens and of the refresh tokens used to renew them
+    'ACCESS_TOKEN_EXPIRATION': 600,
+    'REFRESH_TOKEN_EXPIRATION': 30 * 24 * 3600,
+    # Passwords are hashed with this passlib scheme and number of rounds, older hashes are upgraded at login
+    'PASSWORD_HASH_SCHEME': 'sha512_crypt',
+    'PASSWORD_HASH_ROUNDS': 100000,
+    # Size of the hashing process pool, 0 hashes on the request thread
+    'PASSWORD_HASH_WORKERS': 2,
+    'PASSWORD_HASH_MAX_PENDING': 16,
+    # Seconds to wait for a hashing slot before answering 503
+    'PASSWORD_HASH_TIMEOUT': 5,
+    'SQLALCHEMY_POOL_SIZE': 5,
+    # GET requests are served from this database (a replica, for example).
+    # When None, the main database is opened read-only.
+    'SQLALCHEMY_READ_DATABASE_URI': None,
+    'SQLALCHEMY_READ_POOL_SIZE': 10,
+    # Number of days for an activity use to count half as much in autocomplete ranking
+    'ACTIVITY_USAGE_HALF_LIFE': 30,
+    # Memory, in bytes, for the cached results of the search endpoints
+    'SEARCH_CACHE_SIZE': 16 * 1024 * 1024,
+    # Days older than this many days are moved to cold storage by "manage.py archive"
+    'ARCHIVE_AFTER_DAYS': 365,
+}
+
+ENVIRONMENT_PREFIX = 'LIFEHISTORY_'
+
+
+def parse_value(value, default):
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def from_environment(environ=None):
+    if environ is None:
+        environ = os.environ
+    config = {}
+    for key, default in DEFAULTS.items():
+        name = ENVIRONMENT_PREFIX + key
+        if name in environ:
+            config[key] = parse_value(environ[name], default)
+    return config
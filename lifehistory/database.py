@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+from flask import current_app, request, has_request_context, _app_ctx_stack
+from flask.ext.sqlalchemy import SQLAlchemy as BaseSQLAlchemy, BaseQuery
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import scoped_session, Session as SessionBase
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import QueuePool
+
+# HTTP methods that never modify data and are served by the read-only engine
+READ_ONLY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def init_app(self, app):
+        # Flask-SQLAlchemy commits at app context teardown, after the request is gone. Replace its
+        # teardown: commit at request teardown, so read-only requests are never committed.
+        teardown_funcs = list(app.teardown_appcontext_funcs)
+        BaseSQLAlchemy.init_app(self, app)
+        app.teardown_appcontext_funcs[:] = teardown_funcs
+
+        @app.teardown_request
+        def commit_session(exc):
+            if app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] and exc is None and request.method not in READ_ONLY_METHODS:
+                self.session.commit()
+
+        @app.teardown_appcontext
+        def remove_session(response_or_exc):
+            self.session.remove()
+            return response_or_exc
+
+    def apply_driver_hacks(self, app, info, options):
+        BaseSQLAlchemy.apply_driver_hacks(self, app, info, options)
+        # SQLite files get a NullPool by default, which ignores SQLALCHEMY_POOL_SIZE.
+        # Use a real queue so the write pool is sized like the read pool.
+        if info.drivername == 'sqlite' and info.database not in (None, '', ':memory:') and options.get('pool_size'):
+            options['poolclass'] = QueuePool
+            options['connect_args'] = {'check_same_thread': False}
+
+
+db = SQLAlchemy()
+
+_read_engine_lock = threading.Lock()
+
+
+def create_read_engine(app):
+    uri = app.config['SQLALCHEMY_READ_DATABASE_URI'] or app.config['SQLALCHEMY_DATABASE_URI']
+    pool_size = app.config['SQLALCHEMY_READ_POOL_SIZE']
+    info = make_url(uri)
+
+    if info.drivername != 'sqlite':
+        return create_engine(uri, pool_size=pool_size)
+
+    if info.database in (None, '', ':memory:'):
+        # an in-memory database can't be shared with a second engine
+        return db.get_engine(app)
+
+    path = os.path.join(app.root_path, info.database)
+
+    def connect():
+        return sqlite3.connect('file:%s?mode=ro' % pathname2url(path), uri=True, check_same_thread=False)
+
+    return create_engine('sqlite://', creator=connect, poolclass=QueuePool, pool_size=pool_size)
+
+
+def get_read_engine(app):
+    # Created on first use, like the write engine, so creating an app stays cheap
+    engine = app.extensions.get('read_engine')
+    if engine is None:
+        with _read_engine_lock:
+            engine = app.extensions.get('read_engine')
+            if engine is None:
+                engine = app.extensions['read_engine'] = create_read_engine(app)
+    return engine
+
+
+class ReadSession(SessionBase):
+    def __init__(self, **options):
+        app = current_app._get_current_object()
+        SessionBase.__init__(self, bind=get_read_engine(app), query_cls=BaseQuery, autoflush=False, **options)
+
+
+# Read-only session, never committed. It is removed at the end of each request.
+read_session = scoped_session(ReadSession, scopefunc=_app_ctx_stack.__ident_func__)
+
+
+def get_session():
+    if has_request_context() and request.method in READ_ONLY_METHODS:
+        return read_session
+    return db.session
+
+
+class RoutingQueryProperty(object):
+    # Replaces Model.query so GET handlers transparently use the read-only engine
+    def __get__(self, obj, type):
+        return get_session().query(type)
+
+db.Model.query = RoutingQueryProperty()
+
+
+def shutdown_read_session(response_or_exc):
+    read_session.remove()
+    return response_or_exc
+
+
+def init_app(app):
+    db.init_app(app)
+    app.teardown_appcontext(shutdown_read_session)
+
+
+def create_missing_indexes():
+    # create_all() only creates missing tables, add the indexes declared on existing ones
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing_indexes = set(index['name'] for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(db.engine)
+
+
+def create_missing_columns():
+    # create_all() doesn't add the columns declared on existing tables
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        existing_columns = set(column['name'] for column in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name not in existing_columns:
+                db.engine.execute('ALTER TABLE %s ADD COLUMN %s' % (quote(table.name), CreateColumn(column).compile(db.engine)))
+
+def drop_indexes(names):
+    # create_all() never removes the indexes that are no longer declared
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        for index in inspector.get_indexes(table.name):
+            if index['name'] in names:
+                db.engine.execute('DROP INDEX %s' % quote(index['name']))
+
+
+def enable_sqlite_autoincrement():
+    """Rebuild the SQLite tables declared with sqlite_autoincrement but created without it.
+
+    Returns the names of the rebuilt tables. Either every table is rebuilt or none is.
+    """
+    if db.engine.name != 'sqlite':
+        return []
+    quote = db.engine.dialect.identifier_preparer.quote
+    rebuilt = []
+    connection = db.engine.connect()
+    sqlite_connection = connection.connection.connection
+    # The sqlite3 module commits before DDL statements like ALTER TABLE: turn off its transaction
+    # handling and open the transaction here, so that a failure cannot leave a renamed *_old table
+    isolation_level = sqlite_connection.isolation_level
+    sqlite_connection.isolation_level = None
+    try:
+        with connection.begin():
+            connection.execute('BEGIN')
+            # Keep the foreign keys of the other tables pointing to the rebuilt table, not the renamed one
+            connection.execute('PRAGMA legacy_alter_table=ON')
+            for table in db.metadata.sorted_tables:
+                if not table.kwargs.get('sqlite_autoincrement'):
+                    continue
+                sql = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", table.name).scalar()
+                if sql is None or 'AUTOINCREMENT' in sql.upper():
+                    continue
+                # The indexes move with the renamed table, drop them so the new table can create them
+                index_names = connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                                                 table.name).fetchall()
+                for index_name, in index_names:
+                    connection.execute('DROP INDEX %s' % quote(index_name))
+                old_name = table.name + '_old'
+                connection.execute('ALTER TABLE %s RENAME TO %s' % (quote(table.name), quote(old_name)))
+                table.create(connection)
+                columns = ', '.join(quote(column.name) for column in table.columns)
+                connection.execute('INSERT INTO %s (%s) SELECT %s FROM %s' % (quote(table.name), columns, columns, quote(old_name)))
+                connection.execute('DROP TABLE %s' % quote(old_name))
+                rebuilt.append(table.name)
+            connection.execute('PRAGMA legacy_alter_table=OFF')
+    finally:
+        sqlite_connection.isolation_level = isolation_level
+        connection.close()
+    return rebuilt
+
+
+def reserve_sqlite_ids(table_name, max_id):
+    # AUTOINCREMENT only hands out ids above the one recorded in sqlite_sequence
+    with db.engine.begin() as connection:
+        result = connection.execute('UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?', max_id, table_name)
+        if not result.rowcount:
+            connection.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', table_name, max_id)
@@ -0,0 +1,586 @@
+import binascii
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from flask import current_app, g
+from itsdangerous import (TimedJSONWebSignatureSerializer
+                          as Serializer, BadSignature, SignatureExpired)
+from sqlalchemy import event, case, literal, Float
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.expression import FunctionElement
+from .database import db
+from .passwords import get_password_hasher
+
+
+# Greater than any character, ends the range of the names starting with a prefix
+MAX_CHARACTER = chr(0x10FFFF)
+
+
+class User(db.Model):
+    __tablename__ = 'users'
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(32), index=True)
+    password_hash = db.Column(db.String(64))
+    # Bumped by every commit changing the user's searchable rows, see cache.py
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    def hash_password(self, password):
+        self.password_hash = get_password_hasher().hash(password)
+
+    def verify_password(self, password):
+        valid, new_hash = get_password_hasher().verify_and_update(password, self.password_hash)
+        if valid and new_hash:
+            # The user may come from the read-only session, save the upgraded hash with the write one
+            db.session.query(User).filter_by(id=self.id).update({'password_hash': new_hash}, synchronize_session=False)
+            db.session.commit()
+            self.password_hash = new_hash
+        return valid
+
+    def generate_auth_token(self, expiration=600):
+        s = Serializer(current_app.config['SECRET_KEY'], expires_in=expiration)
+        return s.dumps({'id': self.id})
+
+    @staticmethod
+    def verify_auth_token(token):
+        s = Serializer(current_app.config['SECRET_KEY'])
+        try:
+            data = s.loads(token)
+        except SignatureExpired:
+            return None    # valid token, but expired
+        except BadSignature:
+            return None    # invalid token
+        user = User.query.get(data['id'])
+        return user
+
+    @staticmethod
+    def verify_user_and_password(username_or_token, password):
+        # first try to authenticate by token
+        user = User.verify_auth_token(username_or_token)
+        if not user:
+            # try to authenticate with username/password
+            user = User.query.filter_by(username=username_or_token).first()
+            if not user or not user.verify_password(password):
+                return False
+            g.password_verified = True
+        g.user = user
+        return True
+
+
+class RefreshToken(db.Model):
+    """Long-lived token exchanged for new access tokens without the password.
+
+    Only a SHA-256 of the token is stored: tokens are random, so a fast hash
+    is enough and lets them be looked up with an index.
+    """
+    __tablename__ = 'refresh_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_date = db.Column(db.DateTime, nullable=False)
+    expiration_date = db.Column(db.DateTime, nullable=False)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    revoked = db.Column(db.Boolean, nullable=False)
+    user = db.relationship('User')
+
+    def __init__(self):
+        self.created_date = datetime.utcnow()
+        self.revoked = False
+
+    @staticmethod
+    def issue(user_id):
+        """Create a refresh token and return it, only its hash is saved."""
+        now = datetime.utcnow()
+        # Always the write session: a token is issued by GET /api/token
+        db.session.query(RefreshToken).filter((RefreshToken.user_id == user_id) & (RefreshToken.expiration_date < now)).delete()
+
+        token = binascii.hexlify(os.urandom(32)).decode('ascii')
+        refresh_token = RefreshToken()
+        refresh_token.user_id = user_id
+        refresh_token.expiration_date = now + timedelta(seconds=current_app.config['REFRESH_TOKEN_EXPIRATION'])
+        refresh_token.token_hash = hash_refresh_token(token)
+        db.session.add(refresh_token)
+        return token
+
+    @staticmethod
+    def rotate(token):
+        """Revoke a refresh token and issue a new one. Returns (user, new token) or None."""
+        refresh_token = db.session.query(RefreshToken).filter_by(token_hash=hash_refresh_token(token)).first()
+        if not refresh_token:
+            return None
+        # Revoke in the UPDATE itself: of two concurrent uses of the same token, only one changes the row
+        revoked = db.session.query(RefreshToken).filter_by(id=refresh_token.id, revoked=False).update({'revoked': True})
+        if revoked != 1:
+            # A token is only used twice if it was stolen: revoke all the tokens of the user
+            db.session.query(RefreshToken).filter_by(user_id=refresh_token.user_id).update({'revoked': True})
+            return None
+        if refresh_token.expiration_date < datetime.utcnow():
+            return None
+        return refresh_token.user, RefreshToken.issue(refresh_token.user_id)
+
+    @staticmethod
+    def revoke(token):
+        db.session.query(RefreshToken).filter_by(token_hash=hash_refresh_token(token)).update({'revoked': True})
+
+
+def hash_refresh_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class ActivityType(db.Model):
+    __tablename__ = 'activity_types'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False)
+    name = db.Column(db.String(128), nullable=False)
+    show_quantity = db.Column(db.Boolean, nullable=False)
+    show_rating = db.Column(db.Boolean, nullable=False)
+
+    def __init__(self):
+        self.created_date = datetime.utcnow()
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'show_quantity': self.show_quantity,
+            'show_rating': self.show_rating
+        }
+
+
+class Activity(db.Model):
+    __tablename__ = 'activities'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False)
+    name = db.Column(db.String(128), nullable=False)
+    activity_type_id = db.Column(db.Integer, db.ForeignKey('activity_types.id'), nullable=False)
+    activity_type = db.relationship('ActivityType', backref=db.backref('activities', lazy='dynamic'))
+
+    def __init__(self):
+        self.created_date = datetime.utcnow()
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'activity_type': ActivityType.serialize(self.activity_type)
+        }
+
+# Case-insensitive name prefixes of a user's activities, see get_name_prefix_filter()
+db.Index('ix_activities_user_id_name_nocase', Activity.user_id, Activity.name.collate('NOCASE'))
+
+
+def get_name_prefix_filter(column, prefix):
+    """Names starting with prefix, ignoring ASCII case like LIKE, as a range an index can use."""
+    name = column.collate('NOCASE')
+    return (name >= prefix) & (name < prefix + MAX_CHARACTER)
+
+
+class Day(db.Model):
+    __tablename__ = 'days'
+    # Never reuse the id of a deleted row, archived rows keep theirs to be restored
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    note = db.Column(db.String(4096))
+    life_entries = db.relationship('LifeEntry', backref='days', lazy='dynamic')
+
+    def __init__(self):
+        self.created_date = datetime.utcnow()
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'date': get_date_string(self.date),
+            'note': self.note,
+            'life_entries': [LifeEntry.serialize(life_entry) for life_entry in self.life_entries]
+        }
+
+
+class LifeEntry(db.Model):
+    __tablename__ = 'life_entries'
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False)
+    day_id = db.Column(db.Integer, db.ForeignKey('days.id'), nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time)
+    life_entry_activities = db.relationship('LifeEntryActivity', backref='life_entries', lazy='dynamic')
+
+    def __init__(self):
+        self.created_date = datetime.utcnow()
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'day_id': self.day_id,
+            'start_time': get_time_string(self.start_time),
+            'end_time': get_time_string(self.end_time),
+            'life_entry_activities': [LifeEntryActivity.serialize(life_entry_activity) for life_entry_activity in self.life_entry_activities]
+        }
+
+
+class LifeEntryActivity(db.Model):
+    __tablename__ = 'life_entry_activities'
+    __table_args__ = {'sqlite_autoincrement': True}
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_date = db.Column(db.DateTime, nullable=False)
+    life_entry_id = db.Column(db.Integer, db.ForeignKey('life_entries.id'), nullable=False)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activities.id'), nullable=False)
+    description = db.Column(db.String(512))
+    quantity = db.Column(db.Float)
+    rating = db.Column(db.Integer)
+    activity = db.relationship('Activity', backref=db.backref('life_entry_activities', lazy='dynamic'))
+
+    def __init__(self):
+        self.created_date = datetime.utcnow()
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'life_entry_id': self.life_entry_id,
+            'description': self.description,
+            'quantity': self.quantity,
+            'rating': self.rating,
+            'activity': Activity.serialize(self.activity)
+        }
+
+
+class ActivityUsage(db.Model):
+    """How often and how recently a user logged an activity, to rank autocomplete.
+
+    score is log(sum(exp(rate * t))) over the dates t (in days) the activity was
+    used. Ordering by it is ordering by the exponentially decayed use count at
+    any point in time, so it never needs to be recomputed as time passes.
+    """
+    __tablename__ = 'activity_usages'
+    activity_id = db.Column(db.Integer, db.ForeignKey('activities.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    use_count = db.Column(db.Integer, nullable=False)
+    last_used_date = db.Column(db.DateTime)
+    score = db.Column(db.Float)
+
+    def __init__(self, activity_id, user_id):
+        self.activity_id = activity_id
+        self.user_id = user_id
+        self.use_count = 0
+
+    def add_use(self, date):
+        self.use_count += 1
+        self.score = add_log_weights(self.score, get_usage_weight(date))
+        if self.last_used_date is None or date > self.last_used_date:
+            self.last_used_date = date
+
+    def serialize(self):
+        return {
+            'use_count': self.use_count,
+            'last_used_date': get_date_string(self.last_used_date)
+        }
+
+    @staticmethod
+    def record_use(activity, date):
+        # Counted in SQL, so concurrent uses of an activity are all counted
+        db.session.flush()
+        usages = ActivityUsage.__table__
+        weight = get_usage_weight(date)
+        date = literal(date, usages.c.last_used_date.type)
+        update = usages.update().where(usages.c.activity_id == activity.id).values(
+            use_count=usages.c.use_count + 1,
+            score=log_add(usages.c.score, weight),
+            last_used_date=case([(usages.c.last_used_date >= date, usages.c.last_used_date)], else_=date))
+        if db.session.execute(update).rowcount:
+            return
+        # First use. On SQLite the insert does nothing when a concurrent first use made the row, update it then
+        insert = usages.insert().prefix_with('OR IGNORE', dialect='sqlite').values(
+            activity_id=activity.id, user_id=activity.user_id, use_count=1, last_used_date=date, score=weight)
+        if not db.session.execute(insert).rowcount:
+            db.session.execute(update)
+
+    @staticmethod
+    def refresh(activity_id):
+        # A removed use can't be subtracted from the score reliably, recompute it from the entries left
+        db.session.flush()
+        ActivityUsage.query.filter_by(activity_id=activity_id).delete()
+        uses = get_activity_uses().filter(LifeEntryActivity.activity_id == activity_id).all()
+        uses.extend((user_id, date) for user_id, date, _ in ArchivedDay.get_activity_uses(activity_id))
+        usage = None
+        for user_id, date in uses:
+            if not usage:
+                usage = ActivityUsage(activity_id, user_id)
+                db.session.add(usage)
+            usage.add_use(date)
+
+    @staticmethod
+    def rebuild_all():
+        ActivityUsage.query.delete()
+        usages = {}
+        uses = get_activity_uses().add_column(LifeEntryActivity.activity_id).all()
+        uses.extend(ArchivedDay.get_activity_uses())
+        for user_id, date, activity_id in uses:
+            if activity_id not in usages:
+                usages[activity_id] = ActivityUsage(activity_id, user_id)
+            usages[activity_id].add_use(date)
+        db.session.add_all(usages.values())
+
+
+def get_activity_uses():
+    return db.session.query(LifeEntryActivity.user_id, Day.date).\
+        join(LifeEntry, LifeEntryActivity.life_entry_id == LifeEntry.id).\
+        join(Day, LifeEntry.day_id == Day.id)
+
+
+def get_search_query(session, user_id):
+    return session.query(LifeEntryActivity.description, LifeEntryActivity.quantity, LifeEntryActivity.rating).filter(LifeEntryActivity.user_id==user_id).\
+                        add_column(Day.id).add_column(Day.date).add_column(LifeEntry.start_time).add_column(LifeEntry.end_time).\
+                        add_column(Activity.name).add_column(ActivityType.name).\
+                        join(LifeEntry).\
+                        join(Day).\
+                        join(LifeEntryActivity.activity).\
+                        join(Activity.activity_type).\
+                        with_labels().order_by(Day.date.desc(), LifeEntry.start_time.desc())
+
+
+def get_usage_weight(date):
+    rate = math.log(2) / current_app.config['ACTIVITY_USAGE_HALF_LIFE']
+    return rate * (date - datetime(1970, 1, 1)).total_seconds() / 86400
+
+
+def add_log_weights(a, b):
+    # log(exp(a) + exp(b)) without overflowing exp
+    if a is None:
+        return b
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+class log_add(FunctionElement):
+    """add_log_weights() in SQL."""
+    type = Float()
+    name = 'log_add'
+
+
+@compiles(log_add)
+def compile_log_add(element, compiler, **kw):
+    a, b = element.clauses
+    values = {'a': compiler.process(a, **kw), 'b': compiler.process(b, **kw)}
+    return 'COALESCE(GREATEST(%(a)s, %(b)s) + LN(1 + EXP(-ABS(%(a)s - %(b)s))), %(b)s)' % values
+
+
+@compiles(log_add, 'sqlite')
+def compile_sqlite_log_add(element, compiler, **kw):
+    # SQLite has no LN or EXP, it calls add_log_weights(), registered on each connection
+    return 'log_add(%s)' % compiler.process(element.clauses, **kw)
+
+
+@event.listens_for(Engine, 'connect')
+def register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('log_add', 2, add_log_weights)
+
+
+class ArchivedDay(db.Model):
+    """A day moved out of the days, life_entries and life_entry_activities tables.
+
+    The whole subtree is kept as one JSON document, with the original ids and
+    dates, so it can be served like a Day and restored exactly. The
+    archived_life_entries and archived_life_entry_activities rows find the day
+    holding a given life entry or life entry activity.
+    """
+    __tablename__ = 'archived_days'
+    __table_args__ = (db.Index('ix_archived_days_user_id_date', 'user_id', 'date', unique=True),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    archived_life_entries = db.relationship('ArchivedLifeEntry', cascade='all, delete-orphan')
+    archived_life_entry_activities = db.relationship('ArchivedLifeEntryActivity', cascade='all, delete-orphan')
+
+    def get_data(self):
+        return json.loads(self.data)
+
+    def serialize(self):
+        data = self.get_data()
+        activities = get_activities_by_id(life_entry_activity['activity_id']
+                                          for life_entry in data['life_entries']
+                                          for life_entry_activity in life_entry['life_entry_activities'])
+
+        def serialize_activity(activity_id):
+            activity = activities.get(activity_id)
+            return Activity.serialize(activity) if activity else None
+
+        return {
+            'id': self.id,
+            'date': get_date_string(self.date),
+            'note': data['note'],
+            'life_entries': [{
+                'id': life_entry['id'],
+                'day_id': self.id,
+                'start_time': life_entry['start_time'],
+                'end_time': life_entry['end_time'],
+                'life_entry_activities': [{
+                    'id': life_entry_activity['id'],
+                    'life_entry_id': life_entry['id'],
+                    'description': life_entry_activity['description'],
+                    'quantity': life_entry_activity['quantity'],
+                    'rating': life_entry_activity['rating'],
+                    'activity': serialize_activity(life_entry_activity['activity_id'])
+                } for life_entry_activity in life_entry['life_entry_activities']]
+            } for life_entry in data['life_entries']]
+        }
+
+    def restore(self):
+        """Move the day back to the hot tables, with its original ids."""
+        data = self.get_data()
+
+        day = Day()
+        day.id = self.id
+        day.user_id = self.user_id
+        day.created_date = parse_datetime(data['created_date'])
+        day.date = self.date
+        day.note = data['note']
+        db.session.add(day)
+
+        for archived_life_entry in data['life_entries']:
+            life_entry = LifeEntry()
+            life_entry.id = archived_life_entry['id']
+            life_entry.user_id = self.user_id
+            life_entry.created_date = parse_datetime(archived_life_entry['created_date'])
+            life_entry.day_id = self.id
+            life_entry.start_time = parse_time(archived_life_entry['start_time'])
+            life_entry.end_time = parse_time(archived_life_entry['end_time'])
+            db.session.add(life_entry)
+
+            for archived_life_entry_activity in archived_life_entry['life_entry_activities']:
+                life_entry_activity = LifeEntryActivity()
+                life_entry_activity.id = archived_life_entry_activity['id']
+                life_entry_activity.user_id = self.user_id
+                life_entry_activity.created_date = parse_datetime(archived_life_entry_activity['created_date'])
+                life_entry_activity.life_entry_id = life_entry.id
+                life_entry_activity.activity_id = archived_life_entry_activity['activity_id']
+                life_entry_activity.description = archived_life_entry_activity['description']
+                life_entry_activity.quantity = archived_life_entry_activity['quantity']
+                life_entry_activity.rating = archived_life_entry_activity['rating']
+                db.session.add(life_entry_activity)
+
+        db.session.delete(self)
+        return day
+
+    def index_entries(self):
+        """Fill the tables that find the archived day of a life entry or life entry activity."""
+        self.archived_life_entries = []
+        self.archived_life_entry_activities = []
+        for life_entry in self.get_data()['life_entries']:
+            self.archived_life_entries.append(ArchivedLifeEntry(id=life_entry['id']))
+            for life_entry_activity in life_entry['life_entry_activities']:
+                self.archived_life_entry_activities.append(
+                    ArchivedLifeEntryActivity(id=life_entry_activity['id'], activity_id=life_entry_activity['activity_id']))
+
+    @staticmethod
+    def get_by_life_entry_id(life_entry_id):
+        return ArchivedDay.query.join(ArchivedDay.archived_life_entries).filter(ArchivedLifeEntry.id == life_entry_id).first()
+
+    @staticmethod
+    def get_by_life_entry_activity_id(life_entry_activity_id):
+        return ArchivedDay.query.join(ArchivedDay.archived_life_entry_activities).\
+            filter(ArchivedLifeEntryActivity.id == life_entry_activity_id).first()
+
+    @staticmethod
+    def from_day(day):
+        life_entries = []
+        for life_entry in day.life_entries.order_by(LifeEntry.id):
+            life_entries.append({
+                'id': life_entry.id,
+                'created_date': get_datetime_string(life_entry.created_date),
+                'start_time': get_time_string(life_entry.start_time),
+                'end_time': get_time_string(life_entry.end_time),
+                'life_entry_activities': [{
+                    'id': life_entry_activity.id,
+                    'created_date': get_datetime_string(life_entry_activity.created_date),
+                    'activity_id': life_entry_activity.activity_id,
+                    'description': life_entry_activity.description,
+                    'quantity': life_entry_activity.quantity,
+                    'rating': life_entry_activity.rating
+                } for life_entry_activity in life_entry.life_entry_activities.order_by(LifeEntryActivity.id)]
+            })
+
+        archived_day = ArchivedDay()
+        archived_day.id = day.id
+        archived_day.user_id = day.user_id
+        archived_day.date = day.date
+        archived_day.data = json.dumps({
+            'created_date': get_datetime_string(day.created_date),
+            'note': day.note,
+            'life_entries': life_entries
+        }, sort_keys=True, separators=(',', ':'))
+        archived_day.index_entries()
+        return archived_day
+
+    @staticmethod
+    def get_activity_uses(activity_id=None):
+        """(user_id, date, activity_id) of every archived life entry activity."""
+        query = db.session.query(ArchivedDay.user_id, ArchivedDay.date, ArchivedLifeEntryActivity.activity_id).\
+            join(ArchivedDay.archived_life_entry_activities)
+        if activity_id is not None:
+            query = query.filter(ArchivedLifeEntryActivity.activity_id == activity_id)
+        return query.all()
+
+
+class ArchivedLifeEntry(db.Model):
+    __tablename__ = 'archived_life_entries'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived_day_id = db.Column(db.Integer, db.ForeignKey('archived_days.id'), nullable=False, index=True)
+
+
+class ArchivedLifeEntryActivity(db.Model):
+    __tablename__ = 'archived_life_entry_activities'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    archived_day_id = db.Column(db.Integer, db.ForeignKey('archived_days.id'), nullable=False, index=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activities.id'), nullable=False, index=True)
+
+
+def get_activities_by_id(activity_ids, session=None):
+    activity_ids = set(activity_ids)
+    if not activity_ids:
+        return {}
+    if session is None:
+        session = db.session
+    activities = session.query(Activity).filter(Activity.id.in_(activity_ids)).options(joinedload(Activity.activity_type))
+    return dict((activity.id, activity) for activity in activities)
+
+
+def get_datetime_string(my_datetime):
+    return my_datetime.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def parse_datetime(datetime_string):
+    return datetime.strptime(datetime_string, '%Y-%m-%d %H:%M:%S.%f')
+
+
+def parse_time(time_string):
+    if time_string is not None:
+        return datetime.strptime(time_string, '%H:%M:%S').time()
+    else:
+        return None
+
+
+def get_time_string(my_time):
+    if my_time is not None:
+        time_tuple = (0, 0, 0, my_time.hour, my_time.minute, my_time.second, 0, 0, 0)
+        return time.strftime("%H:%M:%S", time_tuple)
+    else:
+        return None
+
+
+def get_date_string(my_date):
+    if my_date is not None:
+        return my_date.strftime('%Y-%m-%d')
+    else:
+        return None
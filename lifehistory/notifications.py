@@ -0,0 +1,183 @@
+import json
+import queue
+import threading
+import uuid
+from collections import defaultdict, deque, OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session as SessionBase
+from .models import Day, LifeEntry, LifeEntryActivity
+
+# Sent without an id: the client keeps the id of the last event it received
+RESYNC = (None, {'type': 'resync'})
+
+
+class LocalBroker(object):
+    """Publish/subscribe of change events between the threads of one process.
+
+    Every event gets an id. The last history_size events of each of the last
+    history_users notified users are kept, so a client reconnecting with the
+    id of the last event it received gets the ones it missed, or a resync
+    event when they are no longer known.
+
+    Any object with the same subscribe, unsubscribe and publish methods can be
+    used instead, for example one backed by Redis pub/sub to reach every worker.
+    """
+
+    def __init__(self, queue_size=100, history_size=100, history_users=1000):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self.history_users = history_users
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        # Ids of another broker, from before a restart, are never taken for ours
+        self._id_prefix = '%s-' % uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._histories = OrderedDict()
+        # Events up to this sequence may have been forgotten with a user's history
+        self._forgotten = 0
+
+    def subscribe(self, user_id, last_event_id=None):
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+            if last_event_id is not None:
+                missed = self._get_missed(user_id, last_event_id)
+                if missed is None or len(missed) >= self.queue_size:
+                    subscriber.put_nowait(RESYNC)
+                else:
+                    for item in missed:
+                        subscriber.put_nowait(item)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            self._sequence += 1
+            item = (self._id_prefix + str(self._sequence), event)
+            self._remember(user_id, self._sequence, item)
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(item)
+            except queue.Full:
+                # The client is not keeping up, drop its backlog and ask it to reload
+                drain(subscriber)
+                subscriber.put_nowait(RESYNC)
+
+    def _remember(self, user_id, sequence, item):
+        history = self._histories.pop(user_id, None)
+        if history is None:
+            history = EventHistory(self.history_size)
+        history.add(sequence, item)
+        self._histories[user_id] = history
+        if len(self._histories) > self.history_users:
+            self._histories.popitem(last=False)
+            self._forgotten = self._sequence
+
+    def _get_missed(self, user_id, last_event_id):
+        """The (id, event) items after last_event_id, None if some of them are unknown."""
+        if not last_event_id.startswith(self._id_prefix):
+            return None
+        try:
+            last_sequence = int(last_event_id[len(self._id_prefix):])
+        except ValueError:
+            return None
+        if last_sequence > self._sequence or last_sequence < self._forgotten:
+            return None
+        history = self._histories.get(user_id)
+        if history is None:
+            return []
+        if last_sequence < history.dropped:
+            return None
+        return [item for sequence, item in history.events if sequence > last_sequence]
+
+
+class EventHistory(object):
+    def __init__(self, size):
+        self.events = deque(maxlen=size)
+        # Sequence of the last event pushed out of events
+        self.dropped = 0
+
+    def add(self, sequence, item):
+        if len(self.events) == self.events.maxlen:
+            self.dropped = self.events[0][0]
+        self.events.append((sequence, item))
+
+
+def drain(subscriber):
+    try:
+        while True:
+            subscriber.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def event_stream(broker, user_id, last_event_id=None, heartbeat=15):
+    """Server-Sent Events generator for one client.
+
+    It only waits on its queue, so an idle connection holds no database
+    connection and uses no CPU. The heartbeat comment lets us notice clients
+    that went away and keeps proxies from closing the connection. The browser
+    sends the id of the last event back as Last-Event-ID when it reconnects.
+    """
+    subscriber = broker.subscribe(user_id, last_event_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event_id, event = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': heartbeat\n\n'
+                continue
+            lines = 'event: %s\ndata: %s\n\n' % (event['type'], json.dumps(event))
+            yield lines if event_id is None else 'id: %s\n%s' % (event_id, lines)
+    finally:
+        broker.unsubscribe(user_id, subscriber)
+
+
+# Models whose changes are pushed to the user's event stream
+NOTIFIED_MODELS = {Day: 'day', LifeEntry: 'life_entry', LifeEntryActivity: 'life_entry_activity'}
+
+
+def change_event(instance, operation):
+    name = NOTIFIED_MODELS[type(instance)]
+    result = {'type': name, 'operation': operation, 'id': instance.id}
+    if name == 'life_entry':
+        result['day_id'] = instance.day_id
+    elif name == 'life_entry_activity':
+        result['life_entry_id'] = instance.life_entry_id
+    return result
+
+
+@event.listens_for(SessionBase, 'after_flush')
+def collect_changes(session, flush_context):
+    changes = session.info.setdefault('changes', [])
+    for operation, instances in (('create', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for instance in instances:
+            if type(instance) not in NOTIFIED_MODELS:
+                continue
+            if operation == 'update' and not session.is_modified(instance):
+                continue
+            changes.append((instance.user_id, change_event(instance, operation)))
+
+
+@event.listens_for(SessionBase, 'after_commit')
+def publish_changes(session):
+    changes = session.info.pop('changes', [])
+    if changes and has_app_context():
+        broker = current_app.extensions['broker']
+        for user_id, change in changes:
+            broker.publish(user_id, change)
+
+
+@event.listens_for(SessionBase, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('changes', None)
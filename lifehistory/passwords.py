@@ -0,0 +1,106 @@
+"""Password hashing off the request threads.
+
+A passlib hash takes hundreds of milliseconds of CPU while holding the GIL, so
+hashes are computed in a small process pool. At most PASSWORD_HASH_MAX_PENDING
+hashes are queued at once; other requests wait PASSWORD_HASH_TIMEOUT seconds
+for a slot and then get a 503, instead of stalling the whole server.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from passlib.context import CryptContext
+
+# Schemes of the existing hashes, they are replaced by the configured one at login
+KNOWN_SCHEMES = ['sha512_crypt', 'sha256_crypt']
+
+_contexts = {}
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def get_context(scheme, rounds):
+    key = (scheme, rounds)
+    context = _contexts.get(key)
+    if context is None:
+        schemes = [scheme] + [known_scheme for known_scheme in KNOWN_SCHEMES if known_scheme != scheme]
+        options = {
+            scheme + '__default_rounds': rounds,
+            # hashes with fewer rounds than configured are upgraded too
+            scheme + '__min_rounds': rounds
+        }
+        context = _contexts[key] = CryptContext(schemes=schemes, default=scheme, deprecated=schemes[1:], **options)
+    return context
+
+
+# Run in the worker processes, they must be importable top-level functions
+def hash_password(password, scheme, rounds):
+    return get_context(scheme, rounds).encrypt(password)
+
+
+def verify_and_update(password, password_hash, scheme, rounds):
+    return get_context(scheme, rounds).verify_and_update(password, password_hash)
+
+
+class PasswordHasher(object):
+    def __init__(self, scheme, rounds, workers=2, max_pending=16, timeout=5):
+        self.scheme = scheme
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.scheme, self.rounds)
+
+    def verify_and_update(self, password, password_hash):
+        """Returns (valid, new_hash). new_hash is None unless the hash needs an upgrade."""
+        return self._run(verify_and_update, password, password_hash, self.scheme, self.rounds)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy()
+        try:
+            if not self.workers:
+                return function(*args)
+            executor = self._get_executor()
+            try:
+                return executor.submit(function, *args).result()
+            except BrokenProcessPool:
+                # A worker died (killed, out of memory) and the pool refuses any new work: start another one
+                self._discard_executor(executor)
+                return self._get_executor().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        # Started on first use, so creating an app doesn't start processes.
+        # The workers come from a forkserver: forking the threaded server could copy a held lock.
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('forkserver'))
+        return self._executor
+
+    def _discard_executor(self, executor):
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+
+def init_app(app):
+    app.extensions['password_hasher'] = PasswordHasher(app.config['PASSWORD_HASH_SCHEME'],
+                                                       app.config['PASSWORD_HASH_ROUNDS'],
+                                                       workers=app.config['PASSWORD_HASH_WORKERS'],
+                                                       max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+                                                       timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
@@ -0,0 +1,145 @@
+"""Read path of the hot GET endpoints on SQLAlchemy Core.
+
+The statements are built once and compiled once per application and dialect. They return
+plain rows, so no ORM instance, identity map or change tracking is involved.
+The results are the same dicts as the models' serialize().
+"""
+import threading
+from flask import current_app
+from sqlalchemy import select, bindparam
+from .database import get_session
+from .models import ActivityType, Activity, Day, LifeEntry, LifeEntryActivity, get_date_string, get_time_string
+
+activity_types = ActivityType.__table__
+activities = Activity.__table__
+days = Day.__table__
+life_entries = LifeEntry.__table__
+life_entry_activities = LifeEntryActivity.__table__
+
+ACTIVITY_COLUMNS = [activities.c.id, activities.c.name,
+                    activity_types.c.id, activity_types.c.name, activity_types.c.show_quantity, activity_types.c.show_rating]
+
+LIFE_ENTRY_COLUMNS = [life_entries.c.id, life_entries.c.user_id, life_entries.c.day_id,
+                      life_entries.c.start_time, life_entries.c.end_time,
+                      life_entry_activities.c.id, life_entry_activities.c.description,
+                      life_entry_activities.c.quantity, life_entry_activities.c.rating] + ACTIVITY_COLUMNS
+
+# Rows come in id order, the order the dynamic relationships return them in
+LIFE_ENTRY_FROM = life_entries.\
+    outerjoin(life_entry_activities, life_entry_activities.c.life_entry_id == life_entries.c.id).\
+    outerjoin(activities, activities.c.id == life_entry_activities.c.activity_id).\
+    outerjoin(activity_types, activity_types.c.id == activities.c.activity_type_id)
+
+STATEMENTS = {
+    'activity_types': select([activity_types.c.id, activity_types.c.name,
+                              activity_types.c.show_quantity, activity_types.c.show_rating]).
+        where(activity_types.c.user_id == bindparam('user_id')).
+        order_by(activity_types.c.id),
+    'activities': select(ACTIVITY_COLUMNS).
+        select_from(activities.join(activity_types, activity_types.c.id == activities.c.activity_type_id)).
+        where(activities.c.user_id == bindparam('user_id')).
+        order_by(activities.c.id),
+    'day_by_date': select([days.c.id, days.c.date, days.c.note]).
+        where((days.c.user_id == bindparam('user_id')) & (days.c.date == bindparam('date', type_=days.c.date.type))).
+        limit(1),
+    'day_life_entries': select(LIFE_ENTRY_COLUMNS).
+        select_from(LIFE_ENTRY_FROM).
+        where(life_entries.c.day_id == bindparam('day_id')).
+        order_by(life_entries.c.id, life_entry_activities.c.id),
+    'life_entry': select(LIFE_ENTRY_COLUMNS).
+        select_from(LIFE_ENTRY_FROM).
+        where(life_entries.c.id == bindparam('id')).
+        order_by(life_entry_activities.c.id),
+}
+
+_compiled_lock = threading.Lock()
+
+
+def execute(name, **params):
+    connection = get_session().connection()
+    # Kept with the application: its engines, and their dialects, live as long as it does
+    compiled_statements = current_app.extensions.setdefault('compiled_statements', {})
+    key = (name, connection.dialect)
+    compiled = compiled_statements.get(key)
+    if compiled is None:
+        with _compiled_lock:
+            compiled = compiled_statements.get(key)
+            if compiled is None:
+                compiled = compiled_statements[key] = STATEMENTS[name].compile(dialect=connection.dialect)
+    return connection.execute(compiled, params).fetchall()
+
+
+def serialize_activity_type(id, name, show_quantity, show_rating):
+    return {
+        'id': id,
+        'name': name,
+        'show_quantity': show_quantity,
+        'show_rating': show_rating
+    }
+
+
+def serialize_activity(row):
+    activity_id, name = row[:2]
+    if activity_id is None:
+        return None
+    return {
+        'id': activity_id,
+        'name': name,
+        'activity_type': serialize_activity_type(*row[2:])
+    }
+
+
+def serialize_life_entries(rows):
+    """Group the rows of LIFE_ENTRY_COLUMNS into life entries with their activities."""
+    result = []
+    life_entry = None
+    for row in rows:
+        life_entry_id, user_id, day_id, start_time, end_time, life_entry_activity_id, description, quantity, rating = row[:9]
+        if life_entry is None or life_entry['id'] != life_entry_id:
+            life_entry = {
+                'id': life_entry_id,
+                'day_id': day_id,
+                'start_time': get_time_string(start_time),
+                'end_time': get_time_string(end_time),
+                'life_entry_activities': []
+            }
+            result.append(life_entry)
+        if life_entry_activity_id is not None:
+            life_entry['life_entry_activities'].append({
+                'id': life_entry_activity_id,
+                'life_entry_id': life_entry_id,
+                'description': description,
+                'quantity': quantity,
+                'rating': rating,
+                'activity': serialize_activity(row[9:])
+            })
+    return result
+
+
+def get_activity_types(user_id):
+    return [serialize_activity_type(*row) for row in execute('activity_types', user_id=user_id)]
+
+
+def get_activities(user_id):
+    return [serialize_activity(row) for row in execute('activities', user_id=user_id)]
+
+
+def get_day_by_date(user_id, date):
+    rows = execute('day_by_date', user_id=user_id, date=date)
+    if not rows:
+        return None
+    day_id, day_date, note = rows[0]
+    return {
+        'id': day_id,
+        'date': get_date_string(day_date),
+        'note': note,
+        'life_entries': serialize_life_entries(execute('day_life_entries', day_id=day_id))
+    }
+
+
+def get_life_entry(id):
+    """Returns (user_id, serialized life entry), or None if it doesn't exist."""
+    rows = execute('life_entry', id=id)
+    if not rows:
+        return None
+    return rows[0][1], serialize_life_entries(rows)[0]
@@ -0,0 +1,675 @@
+import json
+from datetime import datetime
+from functools import wraps
+from flask import Blueprint, abort, request, jsonify, g, url_for, Response, current_app
+from flask.ext.httpauth import HTTPBasicAuth
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
+from .database import db, get_session
+from .models import (User, RefreshToken, ActivityType, Activity, Day, LifeEntry, LifeEntryActivity, ActivityUsage, ArchivedDay,
+                     get_name_prefix_filter)
+from . import queries, search
+from .cache import get_search_cache
+from .notifications import event_stream
+from .passwords import PasswordHasherBusy
+
+api = Blueprint('api', __name__)
+auth = HTTPBasicAuth()
+
+
+@auth.verify_password
+def verify_password(username_or_token, password):
+    return User.verify_user_and_password(username_or_token, password)
+
+
+def token_or_login_required(f):
+    # EventSource can't send an Authorization header, it passes the token in the query string.
+    # login_required rejects requests without the header before calling verify_password.
+    login_required = auth.login_required(f)
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.args.get('token')
+        if token is None:
+            return login_required(*args, **kwargs)
+        user = User.verify_auth_token(token)
+        if not user:
+            return auth.auth_error_callback()
+        g.user = user
+        return f(*args, **kwargs)
+    return decorated
+
+
+@api.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    # Too many logins at once, the client can retry
+    return ('', 503, {'Retry-After': '1'})
+
+
+@api.route('/api/authenticate', methods=['POST'])
+def authenticate():
+    username = request.json.get('username')
+    password = request.json.get('password')
+
+    if User.verify_user_and_password(username, password):
+        result = 1
+    else:
+        result = 0
+
+    return (jsonify({'authenticate_result': result}), 200)
+
+
+@api.route('/api/users', methods=['POST'])
+def new_user():
+    username = request.json.get('username')
+    password = request.json.get('password')
+    if username is None or password is None:
+        abort(400)    # missing arguments
+    if User.query.filter_by(username=username).first() is not None:
+        abort(400)    # existing user
+    user = User(username=username)
+    user.hash_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return (jsonify({'username': user.username}), 201,
+            {'Location': url_for('.get_user', id=user.id, _external=True)})
+
+
+@api.route('/api/users/<int:id>')
+def get_user(id):
+    user = User.query.get(id)
+    if not user:
+        abort(400)
+    return jsonify({'username': user.username})
+
+
+def get_token_response(user, refresh_token=None):
+    expiration = current_app.config['ACCESS_TOKEN_EXPIRATION']
+    token = user.generate_auth_token(expiration)
+    result = {'token': token.decode('ascii'), 'duration': expiration}
+    if refresh_token is not None:
+        result['refresh_token'] = refresh_token
+        result['refresh_duration'] = current_app.config['REFRESH_TOKEN_EXPIRATION']
+    return jsonify(result)
+
+
+@api.route('/api/token')
+@auth.login_required
+def get_auth_token():
+    # A refresh token only comes with a real login, not when renewing with a token
+    refresh_token = None
+    if g.get('password_verified'):
+        refresh_token = RefreshToken.issue(g.user.id)
+        db.session.commit()
+    return get_token_response(g.user, refresh_token)
+
+
+@api.route('/api/token/refresh', methods=['POST'])
+def refresh_auth_token():
+    token = request.json.get('refresh_token')
+    if token is None:
+        abort(400)    # missing arguments
+    result = RefreshToken.rotate(token)
+    db.session.commit()
+    if result is None:
+        abort(401)
+    user, refresh_token = result
+    return get_token_response(user, refresh_token)
+
+
+@api.route('/api/token/revoke', methods=['POST'])
+def revoke_auth_token():
+    token = request.json.get('refresh_token')
+    if token is None:
+        abort(400)    # missing arguments
+    RefreshToken.revoke(token)
+    db.session.commit()
+    return ''
+
+
+@api.route('/api/events')
+@token_or_login_required
+def stream_events():
+    # The stream runs after the request teardown, so it doesn't keep a database connection
+    stream = event_stream(current_app.extensions['broker'], g.user.id, request.headers.get('Last-Event-ID'))
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/api/activity_types')
+@auth.login_required
+def get_activity_types():
+    serialized_array = queries.get_activity_types(g.user.id)
+    return Response(json.dumps(serialized_array), mimetype='application/json')
+
+
+@api.route('/api/activity_types', methods=['POST'])
+@auth.login_required
+def new_activity_type():
+    user_id = g.user.id
+    name = request.json.get('name')
+    show_rating = request.json.get('show_rating')
+    show_quantity = request.json.get('show_quantity')
+    
+    activity_type = ActivityType()
+    activity_type.user_id = user_id
+    activity_type.name = name
+    activity_type.show_rating = show_rating
+    activity_type.show_quantity = show_quantity
+
+    db.session.add(activity_type)
+    db.session.commit()
+    return (jsonify(ActivityType.serialize(activity_type)), 201,
+            {'Location': url_for('.get_activity_type', id=activity_type.id, _external=True)})
+
+
+@api.route('/api/activity_types/<int:id>')
+@auth.login_required
+def get_activity_type(id):
+    activity_type = ActivityType.query.get(id)
+    if not activity_type:
+        abort(400)
+    if activity_type.user_id != g.user.id:
+        abort(401)
+    return jsonify(ActivityType.serialize(activity_type))
+
+
+@api.route('/api/activity_types/<int:id>', methods=['PUT'])
+@auth.login_required
+def update_activity_type(id):
+    activity_type = ActivityType.query.get(id)
+    if not activity_type:
+        abort(400)
+    if activity_type.user_id != g.user.id:
+        abort(401)
+
+    name = request.json.get('name')
+    show_rating = request.json.get('show_rating')
+
+    activity_type.name = name
+    activity_type.show_rating = show_rating
+
+    db.session.commit()
+
+    return jsonify(ActivityType.serialize(activity_type))
+
+
+@api.route('/api/activity_types/<int:id>', methods=['DELETE'])
+@auth.login_required
+def delete_activity_type(id):
+    activity_type = ActivityType.query.get(id)
+    if not activity_type:
+        abort(400)
+    if activity_type.user_id != g.user.id:
+        abort(401)
+
+    db.session.delete(activity_type)
+    db.session.commit()
+
+    return ''
+
+
+@api.route('/api/activity_types/search/<search_term>')
+@auth.login_required
+def search_activity_type(search_term):
+    def compute():
+        activity_types = ActivityType.query.filter_by(user_id=g.user.id).filter(ActivityType.name.like('%'+search_term+'%')).\
+            order_by(ActivityType.id).all()
+        serialized_array = [ActivityType.serialize(activity_type) for activity_type in activity_types]
+        return json.dumps(serialized_array)
+
+    result = get_search_cache().get_or_compute(g.user, 'search_activity_type', search_term, compute)
+    return Response(result, mimetype='application/json')
+
+
+@api.route('/api/activities')
+@auth.login_required
+def get_activities():
+    serialized_array = queries.get_activities(g.user.id)
+    return Response(json.dumps(serialized_array), mimetype='application/json')
+
+
+@api.route('/api/activities', methods=['POST'])
+@auth.login_required
+def new_activity():
+    user_id = g.user.id
+    name = request.json.get('name')
+    activity_type_id = request.json.get('activity_type_id')
+    
+    activity_type = ActivityType.query.get(activity_type_id)
+    if not activity_type:
+        abort(400)
+    if activity_type.user_id != g.user.id:
+        abort(401)
+
+    activity = Activity()
+    activity.user_id = user_id
+    activity.name = name
+    activity.activity_type_id = activity_type_id
+
+    db.session.add(activity)
+    db.session.commit()
+    return (jsonify(Activity.serialize(activity)), 201,
+            {'Location': url_for('.get_activity', id=activity.id, _external=True)})
+
+
+@api.route('/api/activities/<int:id>')
+@auth.login_required
+def get_activity(id):
+    activity = Activity.query.get(id)
+    if not activity:
+        abort(400)
+    if activity.user_id != g.user.id:
+        abort(401)
+    return jsonify(Activity.serialize(activity))
+
+
+@api.route('/api/activities/<int:id>', methods=['PUT'])
+@auth.login_required
+def update_activity(id):
+    activity = Activity.query.get(id)
+    if not activity:
+        abort(400)
+    if activity.user_id != g.user.id:
+        abort(401)
+
+    name = request.json.get('name')
+    activity_type_id = request.json.get('activity_type_id')
+
+    activity.name = name
+    activity.activity_type_id = activity_type_id
+
+    db.session.commit()
+
+    return jsonify(Activity.serialize(activity))
+
+
+@api.route('/api/activities/<int:id>', methods=['DELETE'])
+@auth.login_required
+def delete_activity(id):
+    activity = Activity.query.get(id)
+    if not activity:
+        abort(400)
+    if activity.user_id != g.user.id:
+        abort(401)
+
+    ActivityUsage.query.filter_by(activity_id=activity.id).delete()
+    db.session.delete(activity)
+    db.session.commit()
+
+    return ''
+
+
+@api.route('/api/activities/search/<search_term>')
+@auth.login_required
+def search_activity(search_term):
+    def compute():
+        # In creation order, like GET /api/activities, whatever index the query uses
+        activities = Activity.query.filter_by(user_id=g.user.id).filter(Activity.name.like('%'+search_term+'%')).\
+            order_by(Activity.id).all()
+        serialized_array = [Activity.serialize(activity) for activity in activities]
+        return json.dumps(serialized_array)
+
+    result = get_search_cache().get_or_compute(g.user, 'search_activity', search_term, compute)
+    return Response(result, mimetype='application/json')
+
+
+@api.route('/api/search_cache')
+@auth.login_required
+def get_search_cache_stats():
+    return jsonify(get_search_cache().stats())
+
+
+@api.route('/api/activities/autocomplete/<prefix>')
+@auth.login_required
+def autocomplete_activity(prefix):
+    # SQLite treats a negative limit as no limit
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+
+    results = get_session().query(Activity, ActivityUsage).\
+        join(Activity.activity_type).\
+        outerjoin(ActivityUsage, ActivityUsage.activity_id == Activity.id).\
+        options(contains_eager(Activity.activity_type)).\
+        filter(Activity.user_id == g.user.id).\
+        filter(get_name_prefix_filter(Activity.name, prefix)).\
+        order_by(func.coalesce(ActivityUsage.score, 0).desc(), Activity.name).\
+        limit(limit).all()
+
+    def serialize(activity, usage):
+        result = Activity.serialize(activity)
+        if usage:
+            result.update(ActivityUsage.serialize(usage))
+        else:
+            result.update({'use_count': 0, 'last_used_date': None})
+        return result
+
+    serialized_array = [serialize(activity, usage) for activity, usage in results]
+    return Response(json.dumps(serialized_array), mimetype='application/json')
+
+
+@api.route('/api/days', methods=['POST'])
+@auth.login_required
+def new_day():
+    user_id = g.user.id
+    date = datetime.strptime(request.json.get('date'), '%Y-%m-%d')
+    note = request.json.get('note')
+    
+    if Day.query.filter((Day.user_id == g.user.id) & (Day.date == date)).first() is not None:
+        abort(400)
+    if ArchivedDay.query.filter((ArchivedDay.user_id == g.user.id) & (ArchivedDay.date == date)).first() is not None:
+        abort(400)
+
+    day = Day()
+    day.user_id = user_id
+    day.date = date
+    day.note = note
+
+    db.session.add(day)
+    db.session.commit()
+    return (jsonify(Day.serialize(day)), 201,
+            {'Location': url_for('.get_day', id=day.id, _external=True)})
+
+
+@api.route('/api/days/<int:id>')
+@auth.login_required
+def get_day(id):
+    day = Day.query.get(id) or ArchivedDay.query.get(id)
+    if not day:
+        abort(400)
+    if day.user_id != g.user.id:
+        abort(401)
+    return jsonify(day.serialize())
+
+
+@api.route('/api/days/<selected_date>')
+@auth.login_required
+def get_day_by_date(selected_date):
+    date = datetime.strptime(selected_date, '%Y-%m-%d')
+    serialized_day = queries.get_day_by_date(g.user.id, date)
+    if serialized_day:
+        return jsonify(serialized_day)
+    day = ArchivedDay.query.filter((ArchivedDay.user_id == g.user.id) & (ArchivedDay.date == date)).first()
+    if not day:
+        abort(404)
+    return jsonify(day.serialize())
+
+
+def restore_archived_day(archived_day):
+    # An archived day goes back to the hot tables when it, or anything in it, is modified
+    if archived_day.user_id != g.user.id:
+        abort(401)
+    day = archived_day.restore()
+    db.session.flush()
+    return day
+
+
+def get_day_for_update(id):
+    day = Day.query.get(id)
+    if day:
+        return day
+    archived_day = ArchivedDay.query.get(id)
+    if not archived_day:
+        return None
+    return restore_archived_day(archived_day)
+
+
+def get_life_entry_for_update(id):
+    life_entry = LifeEntry.query.get(id)
+    if life_entry:
+        return life_entry
+    archived_day = ArchivedDay.get_by_life_entry_id(id)
+    if not archived_day:
+        return None
+    restore_archived_day(archived_day)
+    return LifeEntry.query.get(id)
+
+
+def get_life_entry_activity_for_update(id):
+    life_entry_activity = LifeEntryActivity.query.get(id)
+    if life_entry_activity:
+        return life_entry_activity
+    archived_day = ArchivedDay.get_by_life_entry_activity_id(id)
+    if not archived_day:
+        return None
+    restore_archived_day(archived_day)
+    return LifeEntryActivity.query.get(id)
+
+
+def find_by_id(serialized_array, id):
+    return next(serialized for serialized in serialized_array if serialized['id'] == id)
+
+
+@api.route('/api/days/<int:id>', methods=['PUT'])
+@auth.login_required
+def update_day(id):
+    day = get_day_for_update(id)
+    if not day:
+        abort(400)
+    if day.user_id != g.user.id:
+        abort(401)
+
+    note = request.json.get('note')
+
+    day.note = note
+    db.session.commit()
+
+    return jsonify(Day.serialize(day))
+
+
+@api.route('/api/life_entries', methods=['POST'])
+@auth.login_required
+def new_life_entry():
+    user_id = g.user.id
+    day_id = request.json.get('day_id')
+    request_start_time = request.json.get('start_time')
+    request_end_time = request.json.get('end_time')
+
+    start_time = datetime.strptime(request_start_time, '%H:%M').time()
+    if request_end_time:
+        end_time = datetime.strptime(request_end_time, '%H:%M').time()
+    else:
+        end_time = None
+    
+    day = get_day_for_update(day_id)
+    if not day:
+        abort(400)
+    if day.user_id != g.user.id:
+        abort(401)
+
+    life_entry = LifeEntry()
+    life_entry.user_id = user_id
+    life_entry.day_id = day_id
+    life_entry.start_time = start_time
+    life_entry.end_time = end_time
+
+    db.session.add(life_entry)
+    db.session.commit()
+    return (jsonify(LifeEntry.serialize(life_entry)), 201,
+            {'Location': url_for('.get_life_entry', id=life_entry.id, _external=True)})
+
+
+@api.route('/api/life_entries/<int:id>')
+@auth.login_required
+def get_life_entry(id):
+    result = queries.get_life_entry(id)
+    if not result:
+        archived_day = ArchivedDay.get_by_life_entry_id(id)
+        if not archived_day:
+            abort(400)
+        result = archived_day.user_id, find_by_id(archived_day.serialize()['life_entries'], id)
+    user_id, serialized_life_entry = result
+    if user_id != g.user.id:
+        abort(401)
+    return jsonify(serialized_life_entry)
+
+
+@api.route('/api/life_entries/<int:id>', methods=['PUT'])
+@auth.login_required
+def update_life_entry(id):
+    life_entry = get_life_entry_for_update(id)
+    if not life_entry:
+        abort(400)
+    if life_entry.user_id != g.user.id:
+        abort(401)
+
+    request_start_time = request.json.get('start_time')
+    request_end_time = request.json.get('end_time')
+
+    start_time = datetime.strptime(request_start_time, '%H:%M').time()
+    if request_end_time:
+        end_time = datetime.strptime(request_end_time, '%H:%M').time()
+    else:
+        end_time = None
+
+    life_entry.start_time = start_time
+    life_entry.end_time = end_time
+
+    db.session.commit()
+
+    return jsonify(LifeEntry.serialize(life_entry))
+
+
+@api.route('/api/life_entries/<int:id>', methods=['DELETE'])
+@auth.login_required
+def delete_life_entry(id):
+    life_entry = get_life_entry_for_update(id)
+    if not life_entry:
+        abort(400)
+    if life_entry.user_id != g.user.id:
+        abort(401)
+
+    activity_ids = set(life_entry_activity.activity_id for life_entry_activity in life_entry.life_entry_activities)
+
+    db.session.query(LifeEntryActivity).filter_by(life_entry_id=life_entry.id).delete()
+    db.session.delete(life_entry)
+
+    for activity_id in activity_ids:
+        ActivityUsage.refresh(activity_id)
+
+    db.session.commit()
+    return ''
+
+
+@api.route('/api/life_entries/search', methods=['POST'])
+@auth.login_required
+def search_life_entries():
+    activity_id = request.json.get('activity_id')
+    activity_type_id = request.json.get('activity_type_id')
+    start_date = request.json.get('start_date')
+    end_date = request.json.get('end_date')
+    text = request.json.get('text')
+
+    # JSON gives a hashable key whatever the types sent by the client
+    params = json.dumps([activity_id, activity_type_id, start_date, end_date, text])
+    result = get_search_cache().get_or_compute(g.user, 'search_life_entries', params,
+                                               lambda: json.dumps(search.search_life_entries(g.user.id, activity_id, activity_type_id,
+                                                                                             start_date, end_date, text)))
+    return Response(result, mimetype='application/json')
+
+
+@api.route('/api/life_entry_activities', methods=['POST'])
+@auth.login_required
+def new_life_entry_activity():
+    user_id = g.user.id
+    life_entry_id = request.json.get('life_entry_id')
+    activity_id = request.json.get('activity_id')
+    description = request.json.get('description')
+    quantity = request.json.get('quantity')
+    rating = request.json.get('rating')
+
+    life_entry = get_life_entry_for_update(life_entry_id)
+    if not life_entry:
+        abort(400)
+    if life_entry.user_id != g.user.id:
+        abort(401)
+
+    activity = Activity.query.get(activity_id)
+    if not activity:
+        abort(400)
+    if activity.user_id != g.user.id:
+        abort(401)
+
+    life_entry_activity = LifeEntryActivity()
+    life_entry_activity.user_id = user_id
+    life_entry_activity.life_entry_id = life_entry_id
+    life_entry_activity.activity_id = activity_id
+    life_entry_activity.description = description
+    life_entry_activity.quantity = quantity
+    life_entry_activity.rating = rating
+
+    db.session.add(life_entry_activity)
+    ActivityUsage.record_use(activity, life_entry.days.date)
+    db.session.commit()
+    return (jsonify(LifeEntryActivity.serialize(life_entry_activity)), 201,
+            {'Location': url_for('.get_life_entry_activity', id=life_entry_activity.id, _external=True)})
+
+
+@api.route('/api/life_entry_activities/<int:id>')
+@auth.login_required
+def get_life_entry_activity(id):
+    life_entry_activity = LifeEntryActivity.query.get(id)
+    if not life_entry_activity:
+        archived_day = ArchivedDay.get_by_life_entry_activity_id(id)
+        if not archived_day:
+            abort(400)
+        if archived_day.user_id != g.user.id:
+            abort(401)
+        life_entry_activities = [life_entry_activity
+                                 for life_entry in archived_day.serialize()['life_entries']
+                                 for life_entry_activity in life_entry['life_entry_activities']]
+        return jsonify(find_by_id(life_entry_activities, id))
+    if life_entry_activity.user_id != g.user.id:
+        abort(401)
+    return jsonify(LifeEntryActivity.serialize(life_entry_activity))
+
+
+@api.route('/api/life_entry_activities/<int:id>', methods=['PUT'])
+@auth.login_required
+def update_life_entry_activity(id):
+    life_entry_activity = get_life_entry_activity_for_update(id)
+    if not life_entry_activity:
+        abort(400)
+    if life_entry_activity.user_id != g.user.id:
+        abort(401)
+
+    activity_id = request.json.get('activity_id')
+    description = request.json.get('description')
+    quantity = request.json.get('quantity')
+    rating = request.json.get('rating')
+
+    activity = Activity.query.get(activity_id)
+    if not activity:
+        abort(400)
+    if activity.user_id != g.user.id:
+        abort(401)
+
+    previous_activity_id = life_entry_activity.activity_id
+
+    life_entry_activity.activity_id = activity_id
+    life_entry_activity.description = description
+    life_entry_activity.quantity = quantity
+    life_entry_activity.rating = rating
+
+    if activity.id != previous_activity_id:
+        ActivityUsage.refresh(previous_activity_id)
+        ActivityUsage.record_use(activity, life_entry_activity.life_entries.days.date)
+
+    db.session.commit()
+
+    return jsonify(LifeEntryActivity.serialize(life_entry_activity))
+
+
+@api.route('/api/life_entry_activities/<int:id>', methods=['DELETE'])
+@auth.login_required
+def delete_life_entry_activity(id):
+    life_entry_activity = get_life_entry_activity_for_update(id)
+    if not life_entry_activity:
+        abort(400)
+    if life_entry_activity.user_id != g.user.id:
+        abort(401)
+
+    db.session.delete(life_entry_activity)
+    ActivityUsage.refresh(life_entry_activity.activity_id)
+    db.session.commit()
+
+    return ''
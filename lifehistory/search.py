@@ -0,0 +1,54 @@
+"""Search of life entry activities, hot and archived."""
+from sqlalchemy import or_
+from .archive import search_archived_days, merge_search_results
+from .database import read_session
+from .models import ActivityType, Activity, Day, LifeEntryActivity, get_date_string, get_time_string, get_search_query
+
+
+def search_life_entries(user_id, activity_id=None, activity_type_id=None, start_date=None, end_date=None, text=None):
+    """Matching life entry activities, newest first. Nothing when no filter is given."""
+    # The search endpoint is a POST only because of the JSON body, it is a read: use the read-only engine
+    query = get_search_query(read_session, user_id)
+
+    no_parameters = True
+
+    if activity_id is not None:
+        query = query.filter(LifeEntryActivity.activity_id==activity_id)
+        no_parameters = False
+
+    if activity_type_id is not None:
+        query = query.filter(Activity.activity_type_id==activity_type_id)
+        no_parameters = False
+
+    if start_date is not None:
+        query = query.filter(Day.date>=start_date)
+        no_parameters = False
+
+    if end_date is not None:
+        query = query.filter(Day.date<=end_date)
+        no_parameters = False
+
+    if text is not None:
+        text_pattern = '%' + text + '%'
+        query = query.filter(or_(Activity.name.like(text_pattern), ActivityType.name.like(text_pattern), LifeEntryActivity.description.like(text_pattern)))
+        no_parameters = False
+
+    if no_parameters:
+        return []
+
+    def serialize(result_row):
+        return {
+            'day_id': result_row.id,
+            'date': get_date_string(result_row.date),
+            'start_time': get_time_string(result_row.start_time),
+            'end_time': get_time_string(result_row.end_time),
+            'description': result_row.description,
+            'quantity': result_row.quantity,
+            'rating': result_row.rating,
+            'activity_type_name': result_row.name,
+            'activity_name': result_row[7]
+        }
+
+    serialized_array = [serialize(result_row) for result_row in query.all()]
+    archived_results = search_archived_days(read_session, user_id, activity_id, activity_type_id, start_date, end_date, text)
+    return merge_search_results(serialized_array, archived_results)
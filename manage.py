@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import argparse
+import time
+from lifehistory import create_app, init_db
+from lifehistory.archive import archive_days, get_table_sizes
+from lifehistory.database import db, read_session
+from lifehistory.models import User
+from lifehistory.search import search_life_entries
+
+
+def time_search(repeat=5):
+    """Best time, in seconds, to search every life entry of every user, archived ones included."""
+    user_ids = [user_id for user_id, in db.session.query(User.id)]
+    db.session.rollback()
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for user_id in user_ids:
+            search_life_entries(user_id, start_date='1900-01-01')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        read_session.remove()
+        db.session.rollback()
+    return best
+
+
+def archive(app, args):
+    horizon = args.days if args.days is not None else app.config['ARCHIVE_AFTER_DAYS']
+
+    sizes_before = get_table_sizes()
+    search_before = time_search()
+
+    archived = archive_days(horizon, user_id=args.user_id)
+
+    sizes_after = get_table_sizes()
+    search_after = time_search()
+
+    print('Archived %d days older than %d days.' % (archived, horizon))
+    print('%-24s %10s %10s' % ('table', 'before', 'after'))
+    for table in sorted(sizes_before):
+        print('%-24s %10d %10d' % (table, sizes_before[table], sizes_after[table]))
+    print('%-24s %8.1fms %8.1fms' % ('search all entries', search_before * 1000, search_after * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    commands.add_parser('init_db', help='create missing tables and indexes')
+
+    archive_parser = commands.add_parser('archive', help='move old days to cold storage')
+    archive_parser.add_argument('--days', type=int, help='archive days older than this (default: ARCHIVE_AFTER_DAYS)')
+    archive_parser.add_argument('--user-id', type=int, help='only archive the days of this user')
+
+    args = parser.parse_args()
+    app = create_app()
+    with app.app_context():
+        init_db()
+        if args.command == 'archive':
+            archive(app, args)
+
+
+if __name__ == '__main__':
+    main()
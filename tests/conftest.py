@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lifehistory import create_app, init_db
+
+TEST_CONFIG = {
+    'SECRET_KEY': 'test secret key',
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'PASSWORD_HASH_WORKERS': 0,
+    'PASSWORD_HASH_ROUNDS': 1000
+}
+
+
+def make_app(**overrides):
+    config = dict(TEST_CONFIG)
+    config.update(overrides)
+    app = create_app(config)
+    with app.app_context():
+        init_db()
+    return app
+
+
+class ApiClient(object):
+    """Test client sending JSON, authenticated as one user."""
+
+    def __init__(self, app, username='alice', password='secret', create=True):
+        self.app = app
+        self.client = app.test_client()
+        self.username = username
+        self.password = password
+        if create:
+            self.post('/api/users', {'username': username, 'password': password}, auth=False)
+
+    def open(self, method, url, data=None, auth=True, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if auth:
+            headers['Authorization'] = basic_auth(*(auth if isinstance(auth, tuple) else (self.username, self.password)))
+        if data is not None:
+            kwargs['data'] = json.dumps(data)
+            kwargs['content_type'] = 'application/json'
+        return self.client.open(url, method=method, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.open('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.open('POST', url, data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.open('PUT', url, data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.open('DELETE', url, **kwargs)
+
+    def create(self, url, data):
+        response = self.post(url, data)
+        assert response.status_code == 201, response.data
+        return get_json(response)
+
+    def create_entry(self, date, activity_id, start_time='08:00', **values):
+        """Create the day if needed, a life entry and one life entry activity."""
+        response = self.get('/api/days/' + date)
+        day = get_json(response) if response.status_code == 200 else self.create('/api/days', {'date': date})
+        life_entry = self.create('/api/life_entries', {'day_id': day['id'], 'start_time': start_time})
+        values.update({'life_entry_id': life_entry['id'], 'activity_id': activity_id})
+        return self.create('/api/life_entry_activities', values)
+
+
+def basic_auth(username, password):
+    credentials = ('%s:%s' % (username, password)).encode('utf-8')
+    return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+def get_json(response):
+    return json.loads(response.data.decode('utf-8'))
+
+
+@pytest.fixture
+def app():
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return ApiClient(app)
+
+
+@pytest.fixture
+def activity(client):
+    activity_type = client.create('/api/activity_types', {'name': 'Food', 'show_quantity': True, 'show_rating': True})
+    return client.create('/api/activities', {'name': 'Pizza', 'activity_type_id': activity_type['id']})
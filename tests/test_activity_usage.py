@@ -0,0 +1,143 @@
+import os
+import threading
+
+import pytest
+from sqlalchemy import inspect
+
+from conftest import ApiClient, get_json, make_app
+from lifehistory import init_db
+from lifehistory.database import db
+from lifehistory.models import ActivityUsage
+
+
+def autocomplete(client, prefix, **params):
+    return get_json(client.get('/api/activities/autocomplete/' + prefix, query_string=params))
+
+
+def test_ranked_by_use(client, activity):
+    other = client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+    client.create_entry('2017-09-14', other['id'])
+    client.create_entry('2017-09-15', other['id'])
+    client.create_entry('2017-09-15', activity['id'], start_time='12:00')
+
+    results = autocomplete(client, 'P')
+
+    assert [result['name'] for result in results] == ['Pasta', 'Pizza']
+    assert results[0]['use_count'] == 2
+    assert results[0]['last_used_date'] == '2017-09-15'
+
+
+def test_recent_use_ranks_first(client, activity):
+    other = client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+    client.create_entry('2010-01-01', other['id'])
+    client.create_entry('2010-01-02', other['id'], start_time='09:00')
+    client.create_entry('2017-09-14', activity['id'])
+
+    assert [result['name'] for result in autocomplete(client, 'P')] == ['Pizza', 'Pasta']
+
+
+def test_unused_activity_and_limit(client, activity):
+    client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+
+    results = autocomplete(client, 'P', limit=1)
+
+    assert len(results) == 1
+    assert results[0]['use_count'] == 0
+
+
+def test_delete_refreshes_usage(client, activity):
+    first = client.create_entry('2017-09-14', activity['id'])
+    client.create_entry('2017-09-15', activity['id'])
+
+    client.delete('/api/life_entry_activities/%d' % first['id'])
+    [result] = autocomplete(client, 'Pi')
+    assert result['use_count'] == 1
+
+    client.delete('/api/life_entries/%d' % get_json(client.get('/api/days/2017-09-15'))['life_entries'][0]['id'])
+    [result] = autocomplete(client, 'Pi')
+    assert result['use_count'] == 0
+
+
+def test_update_moves_use(client, activity):
+    other = client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+    life_entry_activity = client.create_entry('2017-09-14', activity['id'])
+
+    client.put('/api/life_entry_activities/%d' % life_entry_activity['id'], {'activity_id': other['id']})
+
+    counts = dict((result['name'], result['use_count']) for result in autocomplete(client, 'P'))
+    assert counts == {'Pasta': 1, 'Pizza': 0}
+
+
+def test_negative_limit_returns_one(client, activity):
+    client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+
+    assert len(autocomplete(client, 'P', limit=-1)) == 1
+
+
+def test_search_and_list_keep_creation_order(client, activity):
+    client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+
+    assert [result['name'] for result in get_json(client.get('/api/activities'))] == ['Pizza', 'Pasta']
+    assert [result['name'] for result in get_json(client.get('/api/activities/search/P'))] == ['Pizza', 'Pasta']
+
+
+def test_init_db_drops_obsolete_indexes(app):
+    with app.app_context():
+        db.engine.execute('CREATE INDEX ix_activity_usages_user_id_score ON activity_usages (user_id, score)')
+        db.engine.execute('CREATE INDEX ix_activities_user_id_name ON activities (user_id, name)')
+
+        init_db()
+
+        assert 'ix_activity_usages_user_id_score' not in [index['name'] for index in inspect(db.engine).get_indexes('activity_usages')]
+        assert 'ix_activities_user_id_name' not in [index['name'] for index in inspect(db.engine).get_indexes('activities')]
+
+
+def test_recorded_uses_match_rebuild(app, client, activity):
+    for date in ('2017-09-14', '2017-09-20', '2017-09-02'):
+        client.create_entry(date, activity['id'])
+    with app.app_context():
+        recorded = ActivityUsage.query.get(activity['id'])
+        recorded = (recorded.use_count, recorded.last_used_date, recorded.score)
+
+        ActivityUsage.rebuild_all()
+        db.session.flush()
+        rebuilt = ActivityUsage.query.get(activity['id'])
+
+        assert recorded[:2] == (3, rebuilt.last_used_date)
+        assert recorded[2] == pytest.approx(rebuilt.score)
+
+
+def test_concurrent_uses_are_all_counted(tmpdir):
+    app = make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(str(tmpdir), 'db.sqlite'))
+    client = ApiClient(app)
+    activity_type = client.create('/api/activity_types', {'name': 'Food', 'show_quantity': True, 'show_rating': True})
+    activity = client.create('/api/activities', {'name': 'Pizza', 'activity_type_id': activity_type['id']})
+    life_entry_activity = client.create_entry('2017-09-14', activity['id'])
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def add_use():
+        thread_client = ApiClient(app, create=False)
+        barrier.wait()
+        response = thread_client.post('/api/life_entry_activities',
+                                      {'life_entry_id': life_entry_activity['life_entry_id'], 'activity_id': activity['id']})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=add_use) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [201] * 8
+    [result] = autocomplete(client, 'Pi')
+    assert result['use_count'] == 9
+
+
+def test_prefix_ignores_case_and_wildcards(client, activity):
+    for name in ('pie', '%off', 'Bpizza'):
+        client.create('/api/activities', {'name': name, 'activity_type_id': activity['activity_type']['id']})
+
+    assert sorted(result['name'] for result in autocomplete(client, 'pI')) == ['Pizza', 'pie']
+    assert [result['name'] for result in autocomplete(client, '%')] == ['%off']
+    assert autocomplete(client, '_izza') == []
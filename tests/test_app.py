@@ -0,0 +1,50 @@
+import pytest
+
+from conftest import ApiClient, get_json, make_app
+from lifehistory import create_app
+
+
+def test_apps_are_isolated():
+    first = ApiClient(make_app())
+    second = ApiClient(make_app())
+
+    first.create('/api/activity_types', {'name': 'Food', 'show_quantity': True, 'show_rating': True})
+
+    assert len(get_json(first.get('/api/activity_types'))) == 1
+    assert get_json(second.get('/api/activity_types')) == []
+
+
+def test_configuration_from_environment(monkeypatch):
+    monkeypatch.setenv('LIFEHISTORY_ARCHIVE_AFTER_DAYS', '30')
+    monkeypatch.setenv('LIFEHISTORY_SQLALCHEMY_COMMIT_ON_TEARDOWN', 'false')
+
+    app = make_app()
+
+    assert app.config['ARCHIVE_AFTER_DAYS'] == 30
+    assert app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] is False
+    assert make_app(SQLALCHEMY_COMMIT_ON_TEARDOWN=True).config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] is True
+
+
+def test_secret_key_is_required(monkeypatch):
+    monkeypatch.delenv('LIFEHISTORY_SECRET_KEY', raising=False)
+
+    with pytest.raises(RuntimeError):
+        create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+
+    first = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'DEBUG': True})
+    second = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True})
+    assert first.config['SECRET_KEY'] and first.config['SECRET_KEY'] != second.config['SECRET_KEY']
+
+
+def test_day_with_life_entries(client, activity):
+    client.create_entry('2017-09-14', activity['id'], description='Lunch', quantity=1.5, rating=4)
+
+    day = get_json(client.get('/api/days/2017-09-14'))
+
+    assert day['date'] == '2017-09-14'
+    [life_entry] = day['life_entries']
+    assert life_entry['start_time'] == '08:00:00'
+    [life_entry_activity] = life_entry['life_entry_activities']
+    assert life_entry_activity['description'] == 'Lunch'
+    assert life_entry_activity['activity'] == activity
+
@@ -0,0 +1,251 @@
+import pytest
+
+from sqlalchemy.schema import CreateTable
+
+from conftest import ApiClient, get_json, make_app
+from lifehistory import init_db
+from lifehistory.archive import archive_days
+from lifehistory.database import db
+from lifehistory.models import ArchivedDay, ArchivedLifeEntry, ArchivedLifeEntryActivity, Day, LifeEntry, LifeEntryActivity
+
+
+def archive(client):
+    with client.app.app_context():
+        return archive_days(365)
+
+
+def test_archived_day_is_still_served(client, activity):
+    client.create_entry('2010-05-01', activity['id'], description='Old lunch')
+    before = get_json(client.get('/api/days/2010-05-01'))
+
+    assert archive(client) == 1
+
+    with client.app.app_context():
+        assert Day.query.count() == 0
+        assert ArchivedDay.query.count() == 1
+    assert get_json(client.get('/api/days/2010-05-01')) == before
+    assert get_json(client.get('/api/days/%d' % before['id'])) == before
+    [result] = get_json(client.post('/api/life_entries/search', {'text': 'old lunch'}))
+    assert result['description'] == 'Old lunch'
+
+
+def test_recent_days_are_not_archived(client, activity):
+    client.create_entry('2010-05-01', activity['id'])
+    client.create_entry('2099-05-01', activity['id'])
+
+    assert archive(client) == 1
+    with client.app.app_context():
+        assert [day.date.year for day in Day.query] == [2099]
+
+
+def test_update_restores_day(client, activity):
+    client.create_entry('2010-05-01', activity['id'])
+    before = get_json(client.get('/api/days/2010-05-01'))
+    archive(client)
+
+    response = client.put('/api/days/%d' % before['id'], {'note': 'Restored'})
+
+    assert response.status_code == 200
+    with client.app.app_context():
+        assert ArchivedDay.query.count() == 0
+    before['note'] = 'Restored'
+    assert get_json(client.get('/api/days/2010-05-01')) == before
+
+
+def test_cannot_create_archived_date_again(client, activity):
+    client.create_entry('2010-05-01', activity['id'])
+    archive(client)
+
+    assert client.post('/api/days', {'date': '2010-05-01'}).status_code == 400
+
+
+def test_archived_uses_survive_usage_refresh(client, activity):
+    client.create_entry('2010-05-01', activity['id'])
+    recent = client.create_entry('2099-05-01', activity['id'])
+    archive(client)
+
+    client.delete('/api/life_entry_activities/%d' % recent['id'])
+
+    [result] = get_json(client.get('/api/activities/autocomplete/Pi'))
+    assert result['use_count'] == 1
+    assert result['last_used_date'] == '2010-05-01'
+
+
+def test_new_day_does_not_reuse_archived_id(client, activity):
+    client.create_entry('2010-05-01', activity['id'])
+    old_day = get_json(client.get('/api/days/2010-05-01'))
+    archive(client)
+
+    client.create_entry('2011-05-01', activity['id'])
+    new_day = get_json(client.get('/api/days/2011-05-01'))
+
+    assert new_day['id'] > old_day['id']
+    assert new_day['life_entries'][0]['id'] > old_day['life_entries'][0]['id']
+    assert client.put('/api/days/%d' % old_day['id'], {'note': 'Restored'}).status_code == 200
+    assert archive(client) == 2
+
+
+def test_init_db_rebuilds_legacy_tables(app, client, activity):
+    client.create_entry('2010-05-01', activity['id'], description='Old lunch')
+    client.create_entry('2099-05-01', activity['id'])
+    old_day = get_json(client.get('/api/days/2010-05-01'))
+    archive(client)
+    with app.app_context():
+        make_legacy_tables()
+        # Leave only archived rows, the rebuilt tables start empty
+        for table in ('life_entry_activities', 'life_entries', 'days'):
+            db.engine.execute('DELETE FROM %s' % table)
+
+        init_db()
+
+        for table in ('days', 'life_entries', 'life_entry_activities'):
+            sql = db.engine.execute("SELECT sql FROM sqlite_master WHERE name = ?", table).scalar()
+            assert 'AUTOINCREMENT' in sql
+
+    client.create_entry('2011-05-01', activity['id'])
+    new_day = get_json(client.get('/api/days/2011-05-01'))
+    assert new_day['id'] > old_day['id']
+    assert new_day['life_entries'][0]['id'] > old_day['life_entries'][0]['id']
+    assert get_json(client.get('/api/days/2010-05-01')) == old_day
+
+
+def make_legacy_tables():
+    # The tables as created before sqlite_autoincrement, keeping their rows
+    for table in (Day.__table__, LifeEntry.__table__, LifeEntryActivity.__table__):
+        sql = str(CreateTable(table).compile(db.engine)).replace(' AUTOINCREMENT', '')
+        db.engine.execute('ALTER TABLE %s RENAME TO legacy' % table.name)
+        db.engine.execute(sql)
+        db.engine.execute('INSERT INTO %s SELECT * FROM legacy' % table.name)
+        db.engine.execute('DROP TABLE legacy')
+    db.engine.execute('DELETE FROM sqlite_sequence')
+
+
+def test_archived_life_entries_are_still_served(client, activity):
+    life_entry_activity = client.create_entry('2010-05-01', activity['id'], description='Old lunch')
+    life_entry_url = '/api/life_entries/%d' % life_entry_activity['life_entry_id']
+    life_entry_activity_url = '/api/life_entry_activities/%d' % life_entry_activity['id']
+    life_entry = get_json(client.get(life_entry_url))
+    archive(client)
+
+    assert get_json(client.get(life_entry_url)) == life_entry
+    assert get_json(client.get(life_entry_activity_url)) == life_entry_activity
+    other = ApiClient(client.app, 'bob')
+    assert other.get(life_entry_url).status_code == 401
+    assert other.get(life_entry_activity_url).status_code == 401
+    assert other.put(life_entry_url, {'start_time': '09:00'}).status_code == 401
+    with client.app.app_context():
+        assert ArchivedDay.query.count() == 1
+
+
+def test_update_life_entry_restores_day(client, activity):
+    life_entry_activity = client.create_entry('2010-05-01', activity['id'])
+    archive(client)
+
+    response = client.put('/api/life_entries/%d' % life_entry_activity['life_entry_id'], {'start_time': '09:00'})
+
+    assert response.status_code == 200
+    assert get_json(response)['start_time'] == '09:00:00'
+    with client.app.app_context():
+        assert ArchivedDay.query.count() == 0
+    assert get_json(client.get('/api/days/2010-05-01'))['life_entries'][0]['start_time'] == '09:00:00'
+
+
+def test_add_life_entry_activity_restores_day(client, activity):
+    life_entry_activity = client.create_entry('2010-05-01', activity['id'])
+    archive(client)
+
+    client.create('/api/life_entry_activities', {'life_entry_id': life_entry_activity['life_entry_id'], 'activity_id': activity['id']})
+
+    [life_entry] = get_json(client.get('/api/days/2010-05-01'))['life_entries']
+    assert len(life_entry['life_entry_activities']) == 2
+    [result] = get_json(client.get('/api/activities/autocomplete/Pi'))
+    assert result['use_count'] == 2
+
+
+def test_delete_archived_life_entry_activity(client, activity):
+    life_entry_activity = client.create_entry('2010-05-01', activity['id'])
+    archive(client)
+
+    assert client.delete('/api/life_entry_activities/%d' % life_entry_activity['id']).status_code == 200
+
+    assert client.get('/api/life_entry_activities/%d' % life_entry_activity['id']).status_code == 400
+    assert get_json(client.get('/api/days/2010-05-01'))['life_entries'][0]['life_entry_activities'] == []
+    [result] = get_json(client.get('/api/activities/autocomplete/Pi'))
+    assert result['use_count'] == 0
+
+
+def test_delete_archived_life_entry(client, activity):
+    life_entry_activity = client.create_entry('2010-05-01', activity['id'])
+    archive(client)
+
+    assert client.delete('/api/life_entries/%d' % life_entry_activity['life_entry_id']).status_code == 200
+
+    assert get_json(client.get('/api/days/2010-05-01'))['life_entries'] == []
+
+
+def test_init_db_indexes_archived_days(app, client, activity):
+    life_entry_activity = client.create_entry('2010-05-01', activity['id'])
+    archive(client)
+    with app.app_context():
+        ArchivedLifeEntry.query.delete()
+        ArchivedLifeEntryActivity.query.delete()
+        db.session.commit()
+
+        init_db()
+
+    assert client.get('/api/life_entries/%d' % life_entry_activity['life_entry_id']).status_code == 200
+    assert client.get('/api/life_entry_activities/%d' % life_entry_activity['id']).status_code == 200
+
+
+def test_search_archived_activity(client, activity):
+    other = client.create('/api/activities', {'name': 'Pasta', 'activity_type_id': activity['activity_type']['id']})
+    client.create_entry('2010-05-01', activity['id'], description='Pizza lunch')
+    client.create_entry('2010-05-02', other['id'], description='Pasta lunch')
+    client.create_entry('2099-05-01', activity['id'], description='Future pizza')
+    archive(client)
+
+    results = get_json(client.post('/api/life_entries/search', {'activity_id': activity['id']}))
+
+    assert [result['description'] for result in results] == ['Future pizza', 'Pizza lunch']
+
+
+def test_archived_search_matches_hot_search():
+    results = []
+    for archived in (False, True):
+        client = ApiClient(make_app())
+        activity_type = client.create('/api/activity_types', {'name': 'Food', 'show_quantity': True, 'show_rating': True})
+        pizza = client.create('/api/activities', {'name': 'Pizza', 'activity_type_id': activity_type['id']})
+        client.create_entry('2010-05-01', pizza['id'], description='Pizza lunch')
+        client.create_entry('2010-05-02', pizza['id'], description='10% off, crème')
+        client.create_entry('2010-05-03', pizza['id'])
+        if archived:
+            assert archive(client) == 3
+        searches = [{'activity_id': str(pizza['id'])}, {'activity_type_id': str(activity_type['id'])},
+                    {'activity_id': 'pizza'}, {'text': '%'}, {'text': '_'}, {'text': '10%'}, {'text': 'p_zza'},
+                    {'text': 'LUNCH'}, {'text': 'crème'}, {'text': 'CRÈME'}]
+        results.append([len(get_json(client.post('/api/life_entries/search', search))) for search in searches])
+
+    assert results[0] == [3, 3, 0, 3, 3, 1, 3, 1, 1, 0]
+    assert results[1] == results[0]
+
+
+def test_failed_rebuild_leaves_legacy_tables(app, client, activity, monkeypatch):
+    client.create_entry('2010-05-01', activity['id'])
+    with app.app_context():
+        make_legacy_tables()
+
+        def fail(bind=None, checkfirst=False):
+            raise RuntimeError('interrupted')
+        # days is rebuilt first, the failure on life_entries must undo it
+        monkeypatch.setattr(LifeEntry.__table__, 'create', fail)
+        with pytest.raises(RuntimeError):
+            init_db()
+
+        names = [name for name, in db.engine.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()]
+        assert not [name for name in names if name.endswith('_old')]
+        assert 'AUTOINCREMENT' not in db.engine.execute("SELECT sql FROM sqlite_master WHERE name = 'days'").scalar()
+
+        monkeypatch.undo()
+        init_db()
+
+    assert get_json(client.get('/api/days/2010-05-01'))['life_entries']
@@ -0,0 +1,70 @@
+import os
+
+from sqlalchemy import inspect
+
+from conftest import ApiClient, get_json, make_app
+from lifehistory import init_db
+from lifehistory.database import db
+from lifehistory.models import User
+
+
+def test_repeated_search_is_cached(client, activity):
+    client.get('/api/activities/search/Pi')
+    client.get('/api/activities/search/Pi')
+
+    stats = get_json(client.get('/api/search_cache'))
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+
+def test_write_invalidates_search(client, activity):
+    client.create_entry('2017-09-14', activity['id'], description='Lunch')
+    search = {'text': 'lunch'}
+    assert len(get_json(client.post('/api/life_entries/search', search))) == 1
+
+    client.create_entry('2017-09-15', activity['id'], description='Another lunch')
+
+    assert len(get_json(client.post('/api/life_entries/search', search))) == 2
+
+
+def test_rename_invalidates_search(client, activity):
+    assert len(get_json(client.get('/api/activities/search/Pi'))) == 1
+
+    client.put('/api/activities/%d' % activity['id'], {'name': 'Sushi', 'activity_type_id': activity['activity_type']['id']})
+
+    assert get_json(client.get('/api/activities/search/Pi')) == []
+
+
+def test_write_in_another_process_invalidates_search(tmpdir):
+    # Two apps on one database, like two worker processes, each with its own cache
+    uri = 'sqlite:///' + os.path.join(str(tmpdir), 'db.sqlite')
+    writer = ApiClient(make_app(SQLALCHEMY_DATABASE_URI=uri))
+    reader = ApiClient(make_app(SQLALCHEMY_DATABASE_URI=uri), create=False)
+    activity_type = writer.create('/api/activity_types', {'name': 'Food', 'show_quantity': True, 'show_rating': True})
+    activity = writer.create('/api/activities', {'name': 'Pizza', 'activity_type_id': activity_type['id']})
+    assert len(get_json(reader.get('/api/activities/search/Pi'))) == 1
+
+    writer.put('/api/activities/%d' % activity['id'], {'name': 'Sushi', 'activity_type_id': activity_type['id']})
+
+    assert get_json(reader.get('/api/activities/search/Pi')) == []
+
+
+def test_one_version_bump_per_commit(app, client, activity):
+    with app.app_context():
+        version = User.query.filter_by(username='alice').one().data_version
+
+    client.create_entry('2017-09-14', activity['id'])
+    client.get('/api/token')
+
+    with app.app_context():
+        # Day, life entry and life entry activity, one commit each; issuing a token doesn't bump it
+        assert User.query.filter_by(username='alice').one().data_version == version + 3
+
+
+def test_init_db_adds_missing_columns(app):
+    with app.app_context():
+        db.engine.execute('ALTER TABLE users DROP COLUMN data_version')
+
+        init_db()
+
+        assert 'data_version' in [column['name'] for column in inspect(db.engine).get_columns('users')]
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from conftest import ApiClient, get_json, make_app
+from lifehistory.database import db, read_session
+from lifehistory.models import User
+from lifehistory.passwords import PasswordHasher
+
+
+@pytest.fixture
+def file_app(tmpdir):
+    return make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(str(tmpdir), 'db.sqlite'))
+
+
+def test_reads_use_the_read_only_session(file_app):
+    with file_app.test_request_context('/', method='GET'):
+        assert User.query.session is read_session()
+    with file_app.test_request_context('/', method='POST'):
+        assert User.query.session is db.session()
+
+
+def test_read_only_engine_rejects_writes(file_app):
+    with file_app.app_context():
+        with pytest.raises(OperationalError):
+            read_session.execute("INSERT INTO users (username) VALUES ('mallory')")
+        read_session.remove()
+
+
+def test_writes_are_visible_to_reads(file_app):
+    client = ApiClient(file_app)
+    client.create('/api/activity_types', {'name': 'Food', 'show_quantity': True, 'show_rating': True})
+
+    assert [activity_type['name'] for activity_type in get_json(client.get('/api/activity_types'))] == ['Food']
+
+
+def test_read_requests_are_not_committed(client, monkeypatch):
+    commits = []
+    monkeypatch.setattr(db.session, 'commit', lambda: commits.append(True))
+
+    client.get('/api/activity_types')
+    assert commits == []
+
+    client.post('/api/authenticate', {'username': 'alice', 'password': 'secret'})
+    assert commits == [True]
+
+
+def test_upgraded_password_hash_is_saved_on_get(app, client):
+    with app.app_context():
+        old_hash = User.query.filter_by(username='alice').one().password_hash
+    app.extensions['password_hasher'] = PasswordHasher(app.config['PASSWORD_HASH_SCHEME'], 2000, workers=0)
+
+    assert client.get('/api/activity_types').status_code == 200
+
+    with app.app_context():
+        new_hash = User.query.filter_by(username='alice').one().password_hash
+    assert new_hash != old_hash
+    assert '$rounds=2000$' in new_hash
+
+
+def test_no_commit_on_teardown_when_disabled(monkeypatch):
+    app = make_app(SQLALCHEMY_COMMIT_ON_TEARDOWN=False)
+    client = ApiClient(app)
+    commits = []
+    monkeypatch.setattr(db.session, 'commit', lambda: commits.append(True))
+
+    client.post('/api/authenticate', {'username': 'alice', 'password': 'secret'})
+
+    assert commits == []
+    assert app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] is False
@@ -0,0 +1,96 @@
+import json
+
+from conftest import get_json
+from lifehistory.notifications import LocalBroker, RESYNC
+
+
+def read_chunk(chunks):
+    chunk = next(chunks)
+    return chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+
+
+def open_stream(client, token, last_event_id=None):
+    headers = {'Last-Event-ID': last_event_id} if last_event_id else None
+    response = client.get('/api/events', query_string={'token': token}, auth=False, headers=headers, buffered=False)
+    chunks = iter(response.response)
+    # The stream subscribes when it sends its first chunk
+    assert read_chunk(chunks) == 'retry: 5000\n\n'
+    return response, chunks
+
+
+def read_event(chunks):
+    """(id, event) of the next event, id is None when the event has none."""
+    fields = dict(line.split(': ', 1) for line in read_chunk(chunks).splitlines() if line)
+    return fields.get('id'), json.loads(fields['data'])
+
+
+def test_stream_with_token_and_no_authorization_header(client):
+    token = get_json(client.get('/api/token'))['token']
+
+    response, chunks = open_stream(client, token)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    day = client.create('/api/days', {'date': '2017-09-14'})
+    event_id, event = read_event(chunks)
+    assert event_id
+    assert event['type'] == 'day'
+    assert event['operation'] == 'create'
+    assert event['id'] == day['id']
+    response.close()
+
+
+def test_stream_rejects_invalid_token(client):
+    response = client.get('/api/events', query_string={'token': 'invalid'}, auth=False)
+
+    assert response.status_code == 401
+
+
+def test_stream_requires_authentication(client):
+    assert client.get('/api/events', auth=False).status_code == 401
+
+
+def test_reconnect_replays_missed_events(client):
+    token = get_json(client.get('/api/token'))['token']
+    response, chunks = open_stream(client, token)
+    client.create('/api/days', {'date': '2017-09-14'})
+    last_event_id, _ = read_event(chunks)
+    response.close()
+
+    missed = [client.create('/api/days', {'date': date}) for date in ('2017-09-15', '2017-09-16')]
+
+    response, chunks = open_stream(client, token, last_event_id)
+    assert [read_event(chunks)[1]['id'] for day in missed] == [day['id'] for day in missed]
+    response.close()
+
+
+def test_reconnect_with_unknown_id_resyncs(client):
+    token = get_json(client.get('/api/token'))['token']
+
+    response, chunks = open_stream(client, token, 'unknown-1')
+
+    assert read_event(chunks) == (None, {'type': 'resync'})
+    response.close()
+
+
+def test_forgotten_events_resync():
+    broker = LocalBroker(history_size=2, history_users=1)
+    first_id = publish(broker, 1)
+    second_id = publish(broker, 1)
+    publish(broker, 1)
+    last_id = publish(broker, 1)
+
+    assert broker.subscribe(1, first_id).get_nowait() == RESYNC
+    assert [event_id for event_id, _ in broker.subscribe(1, second_id).queue][-1] == last_id
+    assert broker.subscribe(1, last_id).empty()
+
+    publish(broker, 2)
+    assert broker.subscribe(1, last_id).get_nowait() == RESYNC
+
+
+def publish(broker, user_id):
+    subscriber = broker.subscribe(user_id)
+    broker.publish(user_id, {'type': 'day', 'operation': 'update', 'id': 1})
+    event_id, _ = subscriber.get_nowait()
+    broker.unsubscribe(user_id, subscriber)
+    return event_id
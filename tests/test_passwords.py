@@ -0,0 +1,46 @@
+import os
+import signal
+
+import pytest
+
+from lifehistory.passwords import PasswordHasher, PasswordHasherBusy, hash_password
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher('sha512_crypt', 1000, workers=1)
+    yield hasher
+    if hasher._executor is not None:
+        hasher._executor.shutdown()
+
+
+def test_hash_in_pool(hasher):
+    password_hash = hasher.hash('secret')
+
+    assert hasher.verify_and_update('secret', password_hash) == (True, None)
+    assert hasher.verify_and_update('wrong', password_hash) == (False, None)
+
+
+def test_old_hash_is_upgraded(hasher):
+    valid, new_hash = hasher.verify_and_update('secret', hash_password('secret', 'sha256_crypt', 1000))
+
+    assert valid
+    assert new_hash.startswith('$6$')
+
+
+def test_pool_is_replaced_when_a_worker_dies(hasher):
+    hasher.hash('secret')
+    for pid in list(hasher._executor._processes):
+        os.kill(pid, signal.SIGKILL)
+
+    password_hash = hasher.hash('secret')
+
+    assert hasher.verify_and_update('secret', password_hash)[0]
+
+
+def test_busy():
+    hasher = PasswordHasher('sha512_crypt', 1000, workers=0, max_pending=1, timeout=0.01)
+    hasher._slots.acquire()
+
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('secret')
@@ -0,0 +1,30 @@
+from conftest import ApiClient, get_json, make_app
+from lifehistory.models import Activity, ActivityType, Day, LifeEntry
+
+
+def test_same_json_as_the_models(client, activity):
+    life_entry_activity = client.create_entry('2017-09-14', activity['id'], description='Lunch', quantity=1.5, rating=4)
+    client.create('/api/activities', {'name': 'Apple', 'activity_type_id': activity['activity_type']['id']})
+    life_entry_id = life_entry_activity['life_entry_id']
+
+    with client.app.app_context():
+        activity_types = [ActivityType.serialize(activity_type) for activity_type in ActivityType.query.order_by(ActivityType.id)]
+        activities = [Activity.serialize(activity) for activity in Activity.query.order_by(Activity.id)]
+        day = Day.serialize(Day.query.one())
+        life_entry = LifeEntry.serialize(LifeEntry.query.get(life_entry_id))
+
+    assert get_json(client.get('/api/activity_types')) == activity_types
+    assert get_json(client.get('/api/activities')) == activities
+    assert get_json(client.get('/api/days/2017-09-14')) == day
+    assert get_json(client.get('/api/life_entries/%d' % life_entry_id)) == life_entry
+
+
+def test_compiled_statements_belong_to_the_app():
+    apps = [make_app(), make_app()]
+    for app in apps:
+        get_json(ApiClient(app).get('/api/activity_types'))
+
+    for app in apps:
+        [(name, dialect)] = app.extensions['compiled_statements']
+        assert name == 'activity_types'
+        assert dialect is app.extensions['sqlalchemy'].db.get_engine(app).dialect
@@ -0,0 +1,76 @@
+import os
+import threading
+
+from conftest import ApiClient, basic_auth, get_json, make_app
+
+
+def refresh(client, refresh_token):
+    return client.post('/api/token/refresh', {'refresh_token': refresh_token}, auth=False)
+
+
+def test_login_returns_refresh_token(client):
+    result = get_json(client.get('/api/token'))
+
+    assert result['refresh_token']
+    response = client.get('/api/activity_types', headers={'Authorization': basic_auth(result['token'], '')}, auth=False)
+    assert response.status_code == 200
+
+
+def test_token_login_has_no_refresh_token(client):
+    token = get_json(client.get('/api/token'))['token']
+
+    result = get_json(client.get('/api/token', auth=(token, '')))
+
+    assert 'refresh_token' not in result
+
+
+def test_refresh_rotates_token(client):
+    first = get_json(client.get('/api/token'))['refresh_token']
+
+    response = refresh(client, first)
+
+    assert response.status_code == 200
+    second = get_json(response)['refresh_token']
+    assert second != first
+    assert get_json(client.get('/api/activity_types', auth=(get_json(response)['token'], ''))) == []
+    assert refresh(client, second).status_code == 200
+
+
+def test_reused_refresh_token_revokes_all_tokens(client):
+    first = get_json(client.get('/api/token'))['refresh_token']
+    second = get_json(refresh(client, first))['refresh_token']
+
+    assert refresh(client, first).status_code == 401
+    assert refresh(client, second).status_code == 401
+
+
+def test_revoke(client):
+    refresh_token = get_json(client.get('/api/token'))['refresh_token']
+
+    client.post('/api/token/revoke', {'refresh_token': refresh_token}, auth=False)
+
+    assert refresh(client, refresh_token).status_code == 401
+
+
+def test_unknown_refresh_token(client):
+    assert refresh(client, 'unknown').status_code == 401
+
+
+def test_concurrent_refreshes_issue_one_token(tmpdir):
+    client = ApiClient(make_app(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(str(tmpdir), 'db.sqlite')))
+    first = get_json(client.get('/api/token'))['refresh_token']
+    barrier = threading.Barrier(2)
+    statuses = []
+
+    def use_token():
+        thread_client = ApiClient(client.app, create=False)
+        barrier.wait()
+        statuses.append(refresh(thread_client, first).status_code)
+
+    threads = [threading.Thread(target=use_token) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200, 401]